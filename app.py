@@ -6,10 +6,14 @@ import json
 import requests
 from dotenv import load_dotenv
 load_dotenv()
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, url_for
 from flask_cors import CORS
-from openai import OpenAI
-from research_engine import run_ethical_scraper, safe_get, log_event
+from research_engine import safe_get, log_event, deduplicate_locations, LOCATION_BLACKLIST
+from research_cache import research_domain
+from research_jobs import enqueue_research_job, get_research_job, research_and_save
+from crm_outbox import CRM_OUTBOX_ENABLED, queue_script_to_crm, start_outbox_flusher, outbox_stats
+from script_parser import is_valid_script
+from script_service import SCRIPT_PROMPT_DESCRIPTIONS, generate_script, stream_script
 from urllib.parse import urljoin
 from pathlib import Path
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
@@ -56,6 +60,8 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+start_outbox_flusher(app)
+
 
 
 # API keys and secrets
@@ -63,9 +69,6 @@ RECAPTCHA_SECRET_KEY = os.getenv("RECAPTCHA_SECRET_KEY")
 RECAPTCHA_SITE_KEY = os.getenv("RECAPTCHA_SITE_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# OpenAI client setup
-client = OpenAI(api_key=OPENAI_API_KEY)
-
 # Error handling for uncaught exceptions
 def log_exit():
     logging.warning("⚠️ Python interpreter is exiting unexpectedly.")
@@ -78,6 +81,34 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 sys.excepthook = handle_exception
 
 
+AUTO_RESEARCH_ASYNC = os.getenv("AUTO_RESEARCH_ASYNC", "").strip().lower() in {"1", "true", "yes"}
+
+
+def wants_async():
+    """?async=1 / ?async=0 on the webhook URL, else the AUTO_RESEARCH_ASYNC default."""
+    value = request.args.get("async")
+    if value is None:
+        return AUTO_RESEARCH_ASYNC
+    return value.strip().lower() in {"1", "true", "yes"}
+
+
+def wants_refresh(data=None):
+    """True when the caller asked to bypass the research cache (?refresh=1 or "refresh": true)."""
+    value = request.args.get("refresh") or (data or {}).get("refresh") or ""
+    return str(value).strip().lower() in {"1", "true", "yes"}
+
+
+SCRIPT_STREAMING = os.getenv("SCRIPT_STREAMING", "").strip().lower() in {"1", "true", "yes"}
+
+
+def wants_stream():
+    """?stream=1 / stream form field on POST /results, else the SCRIPT_STREAMING default."""
+    value = request.values.get("stream")
+    if value is None:
+        return SCRIPT_STREAMING
+    return value.strip().lower() in {"1", "true", "yes"}
+
+
 @app.route("/push-to-salesdrip", methods=["POST"])
 def push_to_salesdrip():
     try:
@@ -149,23 +180,30 @@ def auto_research_from_salesdrip():
         if not domain or not company_name or not email or not contact_id:
             logging.warning("❌ Missing one or more required fields.")
             return "❌ Missing CompanyWebsite, CompanyName, Email, or ContactID", 400
+        if not contact_id.isdigit():
+            return "❌ ContactID must be numeric", 400
 
         logging.info(f"🌐 Auto-research webhook hit for {company_name} ({domain}) — ContactID: {contact_id}")
 
-        results = run_ethical_scraper(domain)
-        from salesdrip_export import save_research_to_crm
+        force_refresh = wants_refresh(data)
 
-        # Build research payload
-        research_payload = {
-            "facts": results.get("company_facts", {}),
-            "products_services": results.get("products_services", {}),
-            "locations": results.get("locations", ""),
-            "recent_blog_posts": results.get("articles", []),
-            "social_media": "; ".join(f"{k}: {v}" for k, v in results.get("social_media", {}).items())
-        }
+        # Async mode: hand the research and CRM write to the job pool and return at once
+        if wants_async():
+            job_id = enqueue_research_job(app, {
+                "domain": domain,
+                "company_name": company_name,
+                "email": email,
+                "contact_id": contact_id,
+                "force_refresh": force_refresh
+            })
+            return jsonify({
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": url_for("research_job_status", job_id=job_id)
+            }), 202
 
-        # Save using real contact ID
-        save_research_to_crm(email, company_name, research_payload, contact_id=contact_id)
+        # Research and save using real contact ID
+        results = research_and_save(domain, company_name, email, contact_id, force_refresh=force_refresh)
 
         if "error" in results:
             return f"❌ Research failed: {results['error']}", 500
@@ -196,16 +234,23 @@ def auto_research_from_salesdrip():
         logging.exception("🔥 Auto-research webhook error")
         return f"❌ Error: {str(e)}", 500
 
+@app.route("/research-jobs/<job_id>", methods=["GET"])
+def research_job_status(job_id):
+    job = get_research_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/crm-outbox", methods=["GET"])
+def crm_outbox_status():
+    return jsonify(outbox_stats())
+
 from flask import session, redirect, url_for
 
 
 @app.route("/results", methods=["GET", "POST"])
 @login_required
 def results():
-    import time, re
-    from openai import OpenAI
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
     if request.method == "GET":
         # Show results from session if available
         script_items = session.get("script_items")
@@ -244,76 +289,25 @@ def results():
             missing = [k for k in rep_keys + target_keys if not request.form.get(k)]
             return render_template("form.html", error=f"❌ Missing required fields: {', '.join(missing)}", rep_data=rep_data, target_data=target_data)
 
-        prompt_descriptions = [
-            "Opening: Start with 'Good morning' or 'Good afternoon', give the rep's name and company, and ask a closed-ended factual question about the target company related to freight between USA and Canada.",
-            "Customer Assessment: Ask a closed-ended question that probes how the target manages its freight operations across USA/Canada.",
-            "Needs Assessment: Ask a closed-ended question about the company’s current or upcoming freight needs.",
-            "Risk Assessment: Ask a closed-ended question that highlights risk and consequences of not addressing freight gaps.",
-            "Solution Assessment: Ask a closed-ended question about what the company looks for in a freight partner.",
-            "Needs Objection: Ask a closed-ended question countering the 'we're happy with our current carrier' objection.",
-            "Service Objection: Ask a closed-ended question addressing prior service dissatisfaction.",
-            "Source Objection: Ask a closed-ended question addressing concerns about using brokers.",
-            "Price Objection: Ask a closed-ended question about value relative to cost.",
-            "Time Objection: Ask a closed-ended question countering the 'not a good time' objection.",
-            "Closing Question: Ask a closed-ended final call-to-action or decision qualifier question."
-        ]
-
-        prompt = f"""
-You are a professional cold call script assistant.
-
-Sales Rep: {rep_data['rep_name']} from {rep_data['rep_company']}.
-They are selling: {rep_data['product']}.
-Target company: {target_data['target_name']}.
-
-Please return exactly 11 blocks.
-Each block must be numbered 1–11, and contain exactly 4 bullet points:
-- version A
-- version B
-- version C
-- version D
-
-Do not add commentary. Do not change format. Do not skip numbers.
-
-Instructions:
-""" + "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(prompt_descriptions)])
-
-        start = time.time()
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=2500
-        )
-        raw_output = response.choices[0].message.content.strip()
-        logging.info(f"✅ OpenAI returned in {time.time() - start:.2f}s")
-
-        # Parse response
-        script_items = []
-        current = {"label": "", "options": []}
-        lines = raw_output.splitlines()
-
-        for line in lines:
-            line = line.strip()
-            match = re.match(r"^(\d+)\.\s*(.*)", line)
-            if match:
-                if current["label"]:
-                    script_items.append(current)
-                idx = int(match.group(1)) - 1
-                label_text = match.group(2).strip()
-                if not label_text:
-                    label_text = prompt_descriptions[idx] if idx < len(prompt_descriptions) else f"Block {idx+1}"
-                current = {
-                    "label": label_text,
-                    "options": []
-                }
-            elif line.startswith("- "):
-                current["options"].append(line[2:].strip())
-        if current["label"]:
-            script_items.append(current)
-
-        if len(script_items) != 11 or any(len(item["options"]) != 4 for item in script_items):
-            logging.error("❌ Script format error — expected 11 blocks with 4 options each")
-            logging.error("🔍 Full OpenAI response:\n" + raw_output)
+        prompt_descriptions = SCRIPT_PROMPT_DESCRIPTIONS
+
+        if wants_stream():
+            # Render the empty blocks now; the page pulls the completion from /results/stream
+            session.pop("script_items", None)
+            session["rep_data"] = rep_data
+            session["target_data"] = target_data
+            session["prompt_descriptions"] = prompt_descriptions
+            return render_template("results.html",
+                script_items=[{"label": desc, "options": []} for desc in prompt_descriptions],
+                rep_data=rep_data,
+                target_data=target_data,
+                prompt_descriptions=prompt_descriptions,
+                streaming=True,
+                RECAPTCHA_SITE_KEY=RECAPTCHA_SITE_KEY
+            )
+
+        script_items = generate_script(rep_data, target_data, prompt_descriptions)
+        if not script_items:
             return render_template("form.html",
                                    error="❌ AI response was incomplete or misformatted.",
                                    rep_data=rep_data,
@@ -342,6 +336,58 @@ Instructions:
 
 
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/results/stream", methods=["GET"])
+@login_required
+def results_stream():
+    """Server-Sent Events for the script set up by POST /results in stream mode.
+
+    Emits a "block" event as each block completes, then "done" with the
+    full validated script, or "failed" if the completion was misformatted.
+    """
+    import time
+
+    rep_data = session.get("rep_data")
+    target_data = session.get("target_data")
+    prompt_descriptions = session.get("prompt_descriptions")
+    if not rep_data or not target_data or not prompt_descriptions:
+        return sse_event("failed", {"error": "No script request in this session."}), 200, {"Content-Type": "text/event-stream"}
+
+    def generate():
+        start = time.time()
+        for event, data in stream_script(rep_data, target_data, prompt_descriptions):
+            if event == "block" and data["index"] == 0:
+                logging.info(f"⏱ First script block streamed after {time.time() - start:.2f}s")
+            yield sse_event(event, data)
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+@app.route("/results/commit", methods=["POST"])
+@login_required
+def results_commit():
+    """Save a streamed script to the session so GET /results and regenerate keep working."""
+    script_items = (request.get_json(silent=True) or {}).get("script_items")
+    try:
+        script_items = [
+            {"label": str(item["label"]), "options": [str(opt) for opt in item["options"]]}
+            for item in script_items
+        ]
+    except (TypeError, KeyError):
+        return jsonify({"error": "Malformed script_items"}), 400
+    if not is_valid_script(script_items):
+        return jsonify({"error": "Expected 11 blocks with 4 options each"}), 400
+
+    session["script_items"] = script_items
+    return jsonify({"status": "saved"})
+
+
 @app.route("/run-autoresearch", methods=["POST"])
 def run_autoresearch():
     try:
@@ -351,7 +397,7 @@ def run_autoresearch():
         if not domain or not name:
             return jsonify({"error": "Missing URL or company name"}), 400
 
-        results = run_ethical_scraper(domain)
+        results = research_domain(domain, force_refresh=wants_refresh(data))
 
         # --- Format fallback responses ---
         blog_posts = results.get("articles")
@@ -387,30 +433,7 @@ def run_autoresearch():
         sitemap_locs = results.get("locations", "").split("; ") if results.get("locations") else []
         all_locations = locations_list + sitemap_locs
 
-        def normalize_location_name(name):
-            subs = {
-                "us": "united states",
-                "usa": "united states",
-                "u.s.": "united states",
-                "u.s.a.": "united states",
-                "the united states": "united states"
-            }
-            return subs.get(name.lower().strip(), name.strip().lower())
-
-        def dedup_locations(locations):
-            seen = set()
-            final = []
-            blacklist = {"organic", "international", "headquarters", "hq", "global", "warehouse", "warehouses", "ai", "us"}
-            for loc in sorted(locations, key=lambda x: (-len(x), x)):
-                norm = normalize_location_name(loc)
-                if norm in blacklist:
-                    continue
-                if not any(norm in s for s in seen):
-                    seen.add(norm)
-                    final.append(loc)
-            return final
-
-        cleaned_locations = "; ".join(dedup_locations(all_locations))
+        cleaned_locations = "; ".join(deduplicate_locations(all_locations, blacklist=LOCATION_BLACKLIST))
 
         # Optionally strip likely misclassifications from product list
         bad_keywords = ["API"]
@@ -590,8 +613,6 @@ def get_prompts_for_team(team_id):
 @app.route("/auto-script-from-salesdrip", methods=["POST"])
 def auto_script_from_salesdrip():
     try:
-        from salesdrip_export import save_script_to_crm
-        import time
         import re
 
         def parse_salesdrip_blob(blob: str) -> dict:
@@ -633,80 +654,15 @@ def auto_script_from_salesdrip():
         email = data.get("Email", "")
         contact_id = data.get("ContactID", "")
 
-        # Step 4: Build the prompt
-        prompt_descriptions = [
-            "Opening: Start with 'Good morning' or 'Good afternoon', give the rep's name and company, and ask a closed-ended factual question about the target company related to freight between USA and Canada.",
-            "Customer Assessment: Ask a closed-ended question that probes how the target manages its freight operations across USA/Canada.",
-            "Needs Assessment: Ask a closed-ended question about the company’s current or upcoming freight needs.",
-            "Risk Assessment: Ask a closed-ended question that highlights risk and consequences of not addressing freight gaps.",
-            "Solution Assessment: Ask a closed-ended question about what the company looks for in a freight partner.",
-            "Needs Objection: Ask a closed-ended question countering the 'we're happy with our current carrier' objection.",
-            "Service Objection: Ask a closed-ended question addressing prior service dissatisfaction.",
-            "Source Objection: Ask a closed-ended question addressing concerns about using brokers.",
-            "Price Objection: Ask a closed-ended question about value relative to cost.",
-            "Time Objection: Ask a closed-ended question countering the 'not a good time' objection.",
-            "Closing Question: Ask a closed-ended final call-to-action or decision qualifier question."
-        ]
-
-        prompt = f"""
-You are a professional cold call script assistant.
-
-Sales Rep: {rep_data['rep_name']} from {rep_data['rep_company']}.
-They are selling: {rep_data['product']}.
-Target company: {target_data['target_name']}.
-
-Please return exactly 11 blocks.
-Each block must be numbered 1–11, and contain exactly 4 bullet points:
-- version A
-- version B
-- version C
-- version D
-
-Do not add commentary. Do not change format. Do not skip numbers.
-
-Instructions:
-""" + "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(prompt_descriptions)])
-
-        # Step 5: Generate script
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=2500
-        )
-        raw_output = response.choices[0].message.content.strip()
-
-        # Step 6: Parse the script output (supports "1. Opening:" format)
-        script_items = []
-        current = {"label": "", "options": []}
-        lines = raw_output.splitlines()
-
-        for line in lines:
-            line = line.strip()
-            match = re.match(r"^(\d+)\.\s*(.*)", line)
-            if match:
-                if current["label"]:
-                    script_items.append(current)
-                idx = int(match.group(1)) - 1
-                label_text = match.group(2).strip()
-                if not label_text:
-                    label_text = prompt_descriptions[idx] if idx < len(prompt_descriptions) else f"Block {idx+1}"
-                current = {
-                    "label": label_text,
-                    "options": []
-                }
-            elif line.startswith("- "):
-                current["options"].append(line[2:].strip())
-        if current["label"]:
-            script_items.append(current)
-
-        if len(script_items) != 11 or any(len(item["options"]) != 4 for item in script_items):
-            logging.error("❌ Script format error — check OpenAI output")
-            logging.error("🔍 Raw output:\n" + raw_output)
+        # Step 4: Generate the script, repairing any malformed blocks
+        script_items = generate_script(rep_data, target_data, SCRIPT_PROMPT_DESCRIPTIONS)
+        if not script_items:
             return "❌ Script formatting issue", 500
 
-        # Step 7: Save to CRM (uses *target's* email and contact ID)
-        success = save_script_to_crm(email, rep_data, target_data, script_items, contact_id=contact_id)
+        # Step 5: Save to CRM (uses *target's* email and contact ID)
+        success = queue_script_to_crm(email, rep_data, target_data, script_items, contact_id=contact_id)
+        if success and CRM_OUTBOX_ENABLED:
+            return jsonify({"status": "✅ Script generated and queued for sync"}), 200
         return jsonify({"status": "✅ Script generated and synced" if success else "⚠️ Script generated but failed to sync"}), 200
 
     except Exception as e:
@@ -0,0 +1,86 @@
+import os
+import asyncio
+import atexit
+import logging
+import threading
+
+
+class LoopThread:
+    """An asyncio event loop running on its own daemon thread.
+
+    Sync callers hand it coroutines with submit()/run() and walk async
+    generators with iterate(). Subclasses create their async resources in
+    _setup() and release them in _shutdown(); both run on the loop.
+    """
+
+    thread_name = "loop-thread"
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=self.thread_name, daemon=True)
+        self._thread.start()
+        self.run(self._setup())
+
+    async def _setup(self):
+        pass
+
+    async def _shutdown(self):
+        pass
+
+    def close(self):
+        try:
+            self.run(self._shutdown())
+        except Exception as e:
+            logging.warning(f"⚠️ {type(self).__name__} shutdown error: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def submit(self, coro):
+        """Schedule coro on the loop and return a concurrent Future."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError(f"{type(self).__name__}.submit() called from its own loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    @staticmethod
+    async def _next(items):
+        try:
+            return True, await items.__anext__()
+        except StopAsyncIteration:
+            return False, None
+
+    def iterate(self, items):
+        """Sync generator over the async generator items, pulling one item at a time on the loop."""
+        try:
+            while True:
+                more, item = self.run(self._next(items))
+                if not more:
+                    return
+                yield item
+        finally:
+            self.run(items.aclose())
+
+
+def per_process(factory, on_exit=None, usable=None):
+    """Getter for an object shared by every thread in a worker process.
+
+    The getter builds the object with factory(*args) on first use and again
+    after a fork, so gunicorn workers never share threads, loops or pooled
+    sockets. on_exit(obj) is registered with atexit for each object built.
+    usable(obj) returning False (e.g. a dead thread) also rebuilds it.
+    """
+    state = {"obj": None, "pid": None}
+    lock = threading.Lock()
+
+    def get(*args):
+        with lock:
+            obj = state["obj"]
+            if obj is None or state["pid"] != os.getpid() or (usable and not usable(obj)):
+                obj = state["obj"] = factory(*args)
+                state["pid"] = os.getpid()
+                if on_exit:
+                    atexit.register(on_exit, obj)
+            return obj
+
+    return get
@@ -0,0 +1,76 @@
+"""Compare the location NER stage with the original single-document path.
+
+    python benchmarks/bench_locations.py --repeat 20
+
+Both paths get the same visible text from benchmarks/fixtures. --repeat
+multiplies the corpus to mimic a large site. The legacy path loads the full
+pipeline and runs it over one concatenated string. The current path is
+research_engine.extract_gpe_entities (trimmed pipeline, filtered blocks,
+batched nlp.pipe).
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-unused")
+
+import research_engine
+from parsed_document import ParsedDocument
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_page_blocks(repeat):
+    pages = []
+    for path in sorted(FIXTURES.glob("*.html")):
+        pages.append(list(ParsedDocument(path.read_text(encoding="utf-8"), backend="html.parser").text_blocks))
+    return pages * repeat
+
+
+def legacy_locations(nlp, page_blocks):
+    combined_text = "".join(" ".join(blocks) + " " for blocks in page_blocks)
+    doc = nlp(combined_text)
+    return [ent.text.strip() for ent in doc.ents if ent.label_ == "GPE" and len(ent.text) <= 40]
+
+
+def timed(label, fn, runs):
+    best = float("inf")
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{label:<10} best {best * 1000:8.1f} ms   {len(result):5d} GPE hits   peak RSS {rss_mb:.0f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="Copies of the fixture corpus")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    import spacy
+
+    page_blocks = load_page_blocks(args.repeat)
+    chars = sum(len(b) for blocks in page_blocks for b in blocks)
+    print(f"{len(page_blocks)} pages, {chars} visible chars, model {research_engine.SPACY_MODEL}")
+
+    # Load the trimmed pipeline first so its peak RSS is not inflated by the full one
+    research_engine.get_ner_pipeline()
+    optimised = timed("optimised", lambda: research_engine.extract_gpe_entities(page_blocks), args.runs)
+
+    full = spacy.load(research_engine.SPACY_MODEL)
+    legacy = timed("legacy", lambda: legacy_locations(full, page_blocks), args.runs)
+
+    print(f"deduplicated: legacy {research_engine.deduplicate_locations(legacy)}")
+    print(f"deduplicated: optimised {research_engine.deduplicate_locations(optimised)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare ParsedDocument backends on the fixture corpus.
+
+    python benchmarks/bench_parsers.py --repeat 50
+
+Each backend parses every page in benchmarks/fixtures and builds all the
+views research_engine uses. The script reports the best wall time per
+backend and whether each backend's views match html.parser's.
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from parsed_document import ParsedDocument, available_backends
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def build_views(html, backend):
+    doc = ParsedDocument(html, backend=backend)
+    return (doc.visible_text, doc.title, doc.h1, doc.paragraphs, doc.anchors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="Parses of the corpus per run")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = [path.read_text(encoding="utf-8") for path in sorted(FIXTURES.glob("*.html"))]
+    print(f"{len(corpus)} pages x {args.repeat}, {sum(map(len, corpus)) * args.repeat} bytes per run")
+
+    reference = [build_views(html, "html.parser") for html in corpus]
+    baseline = None
+    for backend in reversed(available_backends()):
+        best = float("inf")
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for html in corpus:
+                    build_views(html, backend)
+            best = min(best, time.perf_counter() - start)
+        baseline = baseline or best
+        matches = [build_views(html, backend) for html in corpus] == reference
+        print(f"{backend:<12} best {best * 1000:8.1f} ms   {baseline / best:5.1f}x html.parser   views match: {matches}")
+
+
+if __name__ == "__main__":
+    main()
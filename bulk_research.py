@@ -0,0 +1,181 @@
+"""Bulk research CLI: pre-research a lead list overnight.
+
+    python bulk_research.py leads.csv -o research.jsonl --workers 8
+
+Reads domains from a CSV (column given by --column, else the first of
+domain / CompanyWebsite / url / website, else the first column) or a JSONL
+file (same keys). Each domain runs through run_ethical_scraper in a process
+pool. One JSON line per domain is appended to the output as it finishes,
+and the domain's canonical key goes to a checkpoint file. Re-running the
+same command skips everything already checkpointed.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from research_cache import canonical_domain
+from research_engine import run_ethical_scraper
+
+DOMAIN_KEYS = ["domain", "CompanyWebsite", "url", "website"]
+
+
+def read_domains(path, column=None):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+            for row in rows:
+                key = column or next((k for k in DOMAIN_KEYS if row.get(k)), None)
+                if key and row.get(key):
+                    yield str(row[key]).strip()
+            return
+
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if column:
+            index = header.index(column)
+        else:
+            index = next((header.index(k) for k in DOMAIN_KEYS if k in header), 0)
+            if not any(k in header for k in DOMAIN_KEYS) and "." in "".join(header):
+                # No header row, the first line is already data
+                yield header[index].strip()
+        for row in reader:
+            if len(row) > index and row[index].strip():
+                yield row[index].strip()
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def research_one(domain, max_articles):
+    # Runs in a worker process. The fetch engine and clients are per_process
+    # getters, so each forked worker builds its own on first use
+    url = domain if domain.startswith("http") else f"https://{domain}"
+    start = time.time()
+    try:
+        results = run_ethical_scraper(url, max_articles=max_articles)
+        cause = results.get("error")
+    except Exception as e:
+        results = {"error": str(e)}
+        cause = type(e).__name__
+    return {
+        "domain": canonical_domain(domain),
+        "url": url,
+        "seconds": round(time.time() - start, 2),
+        "cause": cause,
+        "results": results,
+    }
+
+
+def run(domains, output, checkpoint, workers, max_articles, report_every):
+    done = load_checkpoint(checkpoint)
+    skipped = len(done)
+    pending = []
+    for domain in domains:
+        key = canonical_domain(domain)
+        if key and key not in done:
+            done.add(key)
+            pending.append(domain)
+    print(f"[bulk] {len(pending)} domains to research ({skipped} already checkpointed)", flush=True)
+    if not pending:
+        return 0
+
+    failures = Counter()
+    finished = 0
+    broken = None
+    start = last_report = time.time()
+    queue = iter(pending)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            open(output, "a", encoding="utf-8") as out, \
+            open(checkpoint, "a", encoding="utf-8") as ckpt:
+        # Keep a bounded number of domains in flight instead of submitting the whole list
+        in_flight = set()
+        for domain in queue:
+            in_flight.add(pool.submit(research_one, domain, max_articles))
+            if len(in_flight) >= workers * 2:
+                break
+
+        while in_flight:
+            completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # A worker process died (e.g. OOM-killed); every other future fails the same way
+                    broken = e
+                    continue
+                except Exception as e:
+                    # Worker raised outright; nothing to checkpoint, it will be retried on resume
+                    failures[type(e).__name__] += 1
+                    record = None
+                if record is not None:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    ckpt.write(record["domain"] + "\n")
+                    ckpt.flush()
+                    if record["cause"]:
+                        failures[record["cause"]] += 1
+                finished += 1
+
+                next_domain = None if broken else next(queue, None)
+                if next_domain is not None:
+                    try:
+                        in_flight.add(pool.submit(research_one, next_domain, max_articles))
+                    except BrokenProcessPool as e:
+                        broken = e
+            if broken:
+                break
+
+            if time.time() - last_report >= report_every or not in_flight:
+                last_report = time.time()
+                elapsed = max(last_report - start, 1e-6)
+                rate = finished / elapsed * 60
+                print(
+                    f"[bulk] {finished}/{len(pending)} done, {rate:.1f} domains/min, "
+                    f"{sum(failures.values())} failed {dict(failures.most_common())}",
+                    flush=True
+                )
+
+    if broken:
+        print(
+            f"[bulk] Worker pool broke ({broken}); stopped with {len(pending) - finished} domains not researched. "
+            f"Re-run the same command to resume.",
+            file=sys.stderr, flush=True
+        )
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run run_ethical_scraper over a list of domains.")
+    parser.add_argument("input", help="CSV or .jsonl file of domains")
+    parser.add_argument("-o", "--output", default="bulk_research.jsonl", help="JSONL results file (appended)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--column", help="CSV column / JSON key holding the domain")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--max-articles", type=int, default=5)
+    parser.add_argument("--report-every", type=float, default=15.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    return run(
+        read_domains(args.input, args.column),
+        args.output,
+        args.checkpoint or f"{args.output}.checkpoint",
+        args.workers,
+        args.max_articles,
+        args.report_every,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
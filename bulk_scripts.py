@@ -0,0 +1,299 @@
+"""Bulk script generation through the OpenAI Batch API.
+
+    python bulk_scripts.py contacts.csv -o scripts.jsonl
+    python bulk_scripts.py contacts.csv -o scripts.jsonl --batch-id batch_abc123   # resume polling
+    python bulk_scripts.py contacts.jsonl --local --dry-run                         # offline, no CRM writes
+
+Each row (CSV or JSONL) carries the rep and target fields POST /results
+takes (rep_name, rep_company, product, objection_*, target_name, ...) plus
+email and contact_id. Prompts are built exactly as the web routes build
+them and written to a Batch input file, one /v1/chat/completions request
+per line with custom_id "row-<n>". The batch is submitted and polled until
+it finishes. Its output is parsed, malformed blocks are repaired through
+the script service, and the scripts go to the CRM in batched contact
+updates. One JSON line per contact is written to the output.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import uuid
+import argparse
+
+from script_parser import parse_script, complete_script_blocks, is_valid_script
+from script_service import (
+    SCRIPT_MODEL, SCRIPT_TEMPERATURE, SCRIPT_MAX_TOKENS, SCRIPT_PROMPT_DESCRIPTIONS,
+    build_script_prompt, get_script_service
+)
+
+REP_KEYS = [
+    "rep_email", "rep_name", "rep_company", "product",
+    "objection_needs", "objection_service", "objection_source",
+    "objection_price", "objection_time"
+]
+TARGET_KEYS = [
+    "target_name", "target_url", "recent_news", "locations",
+    "facts", "products_services", "social_media"
+]
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_DONE_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def read_records(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    records = []
+    for row in rows:
+        records.append({
+            "rep_data": {k: str(row.get(k) or "").strip() for k in REP_KEYS},
+            "target_data": {k: str(row.get(k) or "").strip() for k in TARGET_KEYS},
+            "email": str(row.get("email") or row.get("Email") or "").strip(),
+            "contact_id": str(row.get("contact_id") or row.get("ContactID") or "").strip(),
+        })
+    return records
+
+
+def build_batch_input(records, path, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS):
+    """Write one Batch API request line per record; returns the custom_ids in order."""
+    custom_ids = []
+    with open(path, "w", encoding="utf-8") as f:
+        for i, record in enumerate(records):
+            custom_id = f"row-{i}"
+            custom_ids.append(custom_id)
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": SCRIPT_MODEL,
+                    "messages": [{"role": "user", "content": build_script_prompt(
+                        record["rep_data"], record["target_data"], prompt_descriptions
+                    )}],
+                    "temperature": SCRIPT_TEMPERATURE,
+                    "max_tokens": SCRIPT_MAX_TOKENS,
+                },
+            }) + "\n")
+    return custom_ids
+
+
+# --- Batch Backends ---
+
+class OpenAIBatchBackend:
+    """Submits Batch input files to OpenAI and reads back the output files."""
+
+    def __init__(self, client=None):
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = client
+
+    def submit(self, path, description=""):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+            metadata={"description": description} if description else None
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "?"
+        return batch.status, progress
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                lines.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchStub:
+    """Offline stand-in for the Batch endpoint.
+
+    A submitted batch is complete straight away. Each request is answered
+    with respond(body) -> completion text, in the same output-line format
+    OpenAI uses. The default answer is a well-formed script that echoes the
+    block labels.
+    """
+
+    def __init__(self, respond=None):
+        self.respond = respond or self.canned_script
+        self._inputs = {}
+
+    @staticmethod
+    def canned_script(body):
+        instructions = body["messages"][0]["content"].split("Instructions:", 1)[-1]
+        blocks = re.findall(r"^(\d+)\.\s*([^:\n]+)", instructions, flags=re.MULTILINE)
+        return "\n".join(
+            f"{number}. {label}\n" + "\n".join(f"- {label} version {v}" for v in "ABCD")
+            for number, label in blocks
+        )
+
+    def submit(self, path, description=""):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        self._inputs[batch_id] = path
+        return batch_id
+
+    def status(self, batch_id):
+        return "completed", "done"
+
+    def results(self, batch_id):
+        lines = []
+        with open(self._inputs[batch_id], encoding="utf-8") as f:
+            for line in f:
+                request = json.loads(line)
+                lines.append({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "request_id": uuid.uuid4().hex,
+                        "body": {
+                            "model": request["body"]["model"],
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.respond(request["body"])}}],
+                            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                        },
+                    },
+                    "error": None,
+                })
+        return lines
+
+
+# --- Pipeline ---
+
+def wait_for_batch(backend, batch_id, poll_seconds=30, timeout_seconds=24 * 3600):
+    start = time.time()
+    while True:
+        status, progress = backend.status(batch_id)
+        print(f"[batch] {batch_id}: {status} ({progress})", flush=True)
+        if status in BATCH_DONE_STATUSES:
+            return status
+        if time.time() - start > timeout_seconds:
+            return "timeout"
+        time.sleep(poll_seconds)
+
+
+def parse_batch_results(lines, records, repair=True, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS):
+    """Match batch output lines to records and turn each into script_items.
+
+    Returns one dict per record, in record order, with script_items set to
+    None and error set when the request failed or could not be repaired.
+    """
+    by_id = {line["custom_id"]: line for line in lines}
+    parsed = []
+    for i, record in enumerate(records):
+        result = {"custom_id": f"row-{i}", "contact_id": record["contact_id"], "email": record["email"],
+                  "script_items": None, "error": None}
+        parsed.append(result)
+
+        line = by_id.get(result["custom_id"])
+        response = (line or {}).get("response") or {}
+        if line is None:
+            result["error"] = "missing from batch output"
+            continue
+        if line.get("error") or response.get("status_code") != 200:
+            result["error"] = str(line.get("error") or response.get("body"))
+            continue
+
+        raw_output = response["body"]["choices"][0]["message"]["content"].strip()
+        script_items = parse_script(raw_output, prompt_descriptions)
+        if not is_valid_script(script_items):
+            script_items = None
+            if repair:
+                service = get_script_service()
+                script_items = service.run(service.repair(
+                    complete_script_blocks(raw_output, prompt_descriptions),
+                    record["rep_data"], record["target_data"], prompt_descriptions
+                ))
+        if script_items:
+            result["script_items"] = script_items
+        else:
+            result["error"] = "malformed script"
+    return parsed
+
+
+def export_scripts(parsed, records, dry_run=False):
+    """Send every generated script to the CRM in batches; sets result["synced"]."""
+    for result in parsed:
+        result["synced"] = False
+    ready = [(result, record) for result, record in zip(parsed, records) if result["script_items"]]
+    if dry_run or not ready:
+        return
+
+    from salesdrip_export import save_scripts_batch_to_crm
+    report = save_scripts_batch_to_crm([
+        {"email": record["email"], "contact_id": record["contact_id"], "script_items": result["script_items"]}
+        for result, record in ready
+    ])
+    for (result, _), outcome in zip(ready, report):
+        result["synced"] = outcome["ok"]
+        if not outcome["ok"]:
+            result["error"] = f"CRM export failed: {outcome['error']}"
+
+
+def run(records, output, backend, batch_id=None, repair=True, dry_run=False, poll_seconds=30, timeout_seconds=24 * 3600):
+    if not records:
+        print("[batch] Nothing to generate", flush=True)
+        return
+    if batch_id is None:
+        input_path = f"{output}.batch-input.jsonl"
+        build_batch_input(records, input_path)
+        batch_id = backend.submit(input_path, description=f"{len(records)} cold call scripts")
+        print(f"[batch] Submitted {len(records)} requests as {batch_id} (resume with --batch-id {batch_id})", flush=True)
+
+    status = wait_for_batch(backend, batch_id, poll_seconds, timeout_seconds)
+    if status != "completed":
+        print(f"[batch] {batch_id} ended as {status}; nothing exported", flush=True)
+        return
+
+    parsed = parse_batch_results(backend.results(batch_id), records, repair=repair)
+    export_scripts(parsed, records, dry_run=dry_run)
+    with open(output, "a", encoding="utf-8") as out:
+        for result in parsed:
+            out.write(json.dumps(result) + "\n")
+
+    generated = sum(1 for r in parsed if r["script_items"])
+    synced = sum(1 for r in parsed if r["synced"])
+    print(f"[batch] {generated}/{len(parsed)} scripts generated, {synced} synced to CRM", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate cold call scripts for many contacts via the Batch API.")
+    parser.add_argument("input", help="CSV or .jsonl file of rep/target records")
+    parser.add_argument("-o", "--output", default="bulk_scripts.jsonl", help="JSONL results file (appended)")
+    parser.add_argument("--batch-id", help="Poll an already submitted batch instead of submitting a new one")
+    parser.add_argument("--local", action="store_true", help="Use the offline LocalBatchStub instead of OpenAI")
+    parser.add_argument("--dry-run", action="store_true", help="Skip the CRM export")
+    parser.add_argument("--no-repair", action="store_true", help="Don't re-request malformed blocks")
+    parser.add_argument("--poll-seconds", type=float, default=30.0)
+    parser.add_argument("--timeout-hours", type=float, default=24.0)
+    args = parser.parse_args(argv)
+    if args.local and args.batch_id:
+        parser.error("--batch-id can't be used with --local: local batches only exist for the run that submitted them")
+
+    run(
+        read_records(args.input),
+        args.output,
+        LocalBatchStub() if args.local else OpenAIBatchBackend(),
+        batch_id=args.batch_id,
+        repair=not args.no_repair,
+        dry_run=args.dry_run,
+        poll_seconds=args.poll_seconds,
+        timeout_seconds=args.timeout_hours * 3600,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
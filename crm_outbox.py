@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+
+from background import per_process
+from models import db, CrmOutbox
+from salesdrip_auth import GREENROPE_CALL_BUDGET
+from salesdrip_export import (
+    CRM_BATCH_SIZE, build_script_contact, build_research_contact, push_contacts,
+    save_script_to_crm, save_research_to_crm
+)
+
+# Off by default: handlers write to GreenRope directly, as before
+CRM_OUTBOX_ENABLED = os.getenv("CRM_OUTBOX", "").strip().lower() in {"1", "true", "yes"}
+CRM_OUTBOX_POLL_SECONDS = float(os.getenv("CRM_OUTBOX_POLL_SECONDS", "5"))
+CRM_OUTBOX_MAX_ATTEMPTS = int(os.getenv("CRM_OUTBOX_MAX_ATTEMPTS", "10"))
+# How long a flusher owns the rows it picked up. It starts no PUT later than two call
+# budgets (PUT plus a token login) before the lease ends, so no other worker can claim
+# and resend rows that are still in flight
+CRM_OUTBOX_LEASE_SECONDS = max(120, 4 * GREENROPE_CALL_BUDGET)
+CRM_OUTBOX_MAX_BACKOFF = 900
+CRM_OUTBOX_MERGE_ATTEMPTS = 5  # tries when other workers keep changing the same row
+
+_merge_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+# --- Enqueue ---
+
+def enqueue_contact(contact):
+    """Queue one GreenRope contact entry (from build_*_contact) for delivery.
+
+    A contact that already has a pending update gets the new fields merged
+    in by FieldNum, newest value winning, so repeated writes for the same
+    contact go out as one update. Needs an app context.
+    """
+    contact_id = int(contact["contactId"])
+    fields = {str(f["FieldNum"]): f["FieldValue"] for f in contact.get("UserDefinedFields", [])}
+    groups = [g["GroupName"] for g in contact.get("Groups", [])]
+
+    with _merge_lock:
+        for attempt in range(CRM_OUTBOX_MERGE_ATTEMPTS):
+            try:
+                if _merge(contact_id, contact.get("Email"), fields, groups):
+                    break
+            except IntegrityError:
+                # Another worker queued this contact first; merge into its row instead
+                db.session.rollback()
+        else:
+            raise RuntimeError(f"CRM outbox row for contact {contact_id} kept changing; update not queued")
+
+    _ensure_flusher(current_app._get_current_object())
+    _wakeup.set()
+    return True
+
+
+def _merge(contact_id, email, fields, groups):
+    """Insert or merge one pending update; False if another worker changed the row since it was read."""
+    row = db.session.get(CrmOutbox, contact_id)
+    if row is None:
+        db.session.add(CrmOutbox(contact_id=contact_id, email=email,
+                                 groups=json.dumps(groups), fields=json.dumps(fields), version=1))
+        db.session.commit()
+        return True
+
+    merged = json.loads(row.fields)
+    merged.update(fields)
+    values = {
+        "fields": json.dumps(merged),
+        "groups": json.dumps(list(dict.fromkeys(json.loads(row.groups) + groups))),
+        "email": email or row.email,
+        "version": row.version + 1,
+    }
+    if row.status == "dead":
+        values.update(status="pending", attempts=0, next_attempt_at=datetime.utcnow())
+    # Same conditional write as _claim: only lands if nobody merged since the read
+    updated = db.session.execute(
+        update(CrmOutbox)
+        .where(CrmOutbox.contact_id == contact_id, CrmOutbox.version == row.version)
+        .values(**values)
+    ).rowcount
+    db.session.commit()
+    return updated == 1
+
+
+def queue_script_to_crm(email, rep_data, target_data, script_items, contact_id=None):
+    """save_script_to_crm, through the outbox when CRM_OUTBOX is on."""
+    if not CRM_OUTBOX_ENABLED:
+        return save_script_to_crm(email, rep_data, target_data, script_items, contact_id=contact_id)
+    return enqueue_contact(build_script_contact(email, script_items, contact_id))
+
+
+def queue_research_to_crm(email, company_name, research_data, contact_id):
+    """save_research_to_crm, through the outbox when CRM_OUTBOX is on."""
+    if not CRM_OUTBOX_ENABLED:
+        return save_research_to_crm(email, company_name, research_data, contact_id)
+    return enqueue_contact(build_research_contact(email, research_data, contact_id))
+
+
+# --- Flush ---
+
+def _to_contact(row):
+    return {
+        "contactId": row.contact_id,
+        "Email": row.email,
+        "Groups": [{"GroupName": g} for g in json.loads(row.groups)],
+        "UserDefinedFields": [{"FieldNum": int(n), "FieldValue": v} for n, v in json.loads(row.fields).items()]
+    }
+
+
+def _claim(limit):
+    """Lease up to limit due rows to this flusher; other workers skip leased rows."""
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=CRM_OUTBOX_LEASE_SECONDS)
+    due = (CrmOutbox.query
+           .filter(CrmOutbox.status == "pending", CrmOutbox.next_attempt_at <= now)
+           .order_by(CrmOutbox.created_at)
+           .limit(limit)
+           .all())
+    claimed = []
+    for row in due:
+        result = db.session.execute(
+            update(CrmOutbox)
+            .where(CrmOutbox.contact_id == row.contact_id, CrmOutbox.version == row.version,
+                   CrmOutbox.next_attempt_at == row.next_attempt_at)
+            .values(next_attempt_at=lease)
+        )
+        if result.rowcount == 1:
+            claimed.append((row.contact_id, row.version, _to_contact(row)))
+    db.session.commit()
+    return claimed
+
+
+def flush_outbox(limit=CRM_BATCH_SIZE):
+    """Deliver one batch of due outbox entries; returns how many were delivered. Needs an app context."""
+    send_by = time.time() + CRM_OUTBOX_LEASE_SECONDS - 2 * GREENROPE_CALL_BUDGET
+    claimed = _claim(limit)
+    if not claimed:
+        return 0
+
+    report = {r["contact_id"]: r for r in push_contacts([contact for _, _, contact in claimed], deadline=send_by)}
+    delivered = 0
+    now = datetime.utcnow()
+    for contact_id, version, _ in claimed:
+        outcome = report[contact_id]
+        if outcome["ok"]:
+            delivered += 1
+            # A merge that landed while this batch was in flight bumped the version; keep that row
+            deleted = CrmOutbox.query.filter_by(contact_id=contact_id, version=version).delete()
+            if not deleted:
+                db.session.execute(update(CrmOutbox).where(CrmOutbox.contact_id == contact_id)
+                                   .values(next_attempt_at=now, attempts=0, last_error=None, created_at=now))
+            continue
+
+        row = db.session.get(CrmOutbox, contact_id)
+        if row is None:
+            continue
+        row.attempts += 1
+        row.last_error = outcome["error"]
+        if row.attempts >= CRM_OUTBOX_MAX_ATTEMPTS:
+            row.status = "dead"
+            logging.error(f"❌ CRM outbox gave up on contact {contact_id} after {row.attempts} attempts: {row.last_error}")
+        else:
+            row.next_attempt_at = now + timedelta(seconds=min(CRM_OUTBOX_MAX_BACKOFF, 5 * 2 ** row.attempts))
+    db.session.commit()
+    logging.info(f"📤 CRM outbox flushed {delivered}/{len(claimed)} contacts")
+    return delivered
+
+
+def _flush_loop(app):
+    while True:
+        _wakeup.wait(CRM_OUTBOX_POLL_SECONDS)
+        _wakeup.clear()
+        with app.app_context():
+            try:
+                # Keep going while full batches come back, so a backlog drains quickly
+                while flush_outbox() >= CRM_BATCH_SIZE:
+                    pass
+            except Exception:
+                logging.exception("🔥 CRM outbox flush failed")
+            finally:
+                db.session.remove()
+
+
+def _start_flusher(app):
+    thread = threading.Thread(target=_flush_loop, args=(app,), name="crm-outbox", daemon=True)
+    thread.start()
+    return thread
+
+
+# One flusher thread per worker process; restarted if it dies
+_ensure_flusher = per_process(_start_flusher, usable=threading.Thread.is_alive)
+
+
+def start_outbox_flusher(app):
+    if CRM_OUTBOX_ENABLED:
+        _ensure_flusher(app)
+
+
+# --- Stats ---
+
+def outbox_stats():
+    """Queue depth and age of the CRM outbox. Needs an app context."""
+    now = datetime.utcnow()
+    pending, oldest, retrying = db.session.query(
+        func.count(CrmOutbox.contact_id),
+        func.min(CrmOutbox.created_at),
+        func.sum(case((CrmOutbox.attempts > 0, 1), else_=0))
+    ).filter(CrmOutbox.status == "pending").one()
+    dead = CrmOutbox.query.filter_by(status="dead").count()
+    return {
+        "enabled": CRM_OUTBOX_ENABLED,
+        "depth": pending,
+        "retrying": int(retrying or 0),
+        "dead": dead,
+        "oldest_age_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+    }
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from background import per_process
+
+# Parsed company-fact JSON, keyed by what was sent to the model. Plain sqlite3
+# rather than the Flask models so the bulk CLI and worker processes can use it
+# without an app context. Set FACT_CACHE_PATH to an empty string to disable.
+FACT_CACHE_PATH = os.getenv(
+    "FACT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "fact_cache.db")
+)
+FACT_CACHE_TTL = int(os.getenv("FACT_CACHE_TTL", str(30 * 24 * 3600)))
+FACT_CACHE_MAX_ENTRIES = int(os.getenv("FACT_CACHE_MAX_ENTRIES", "5000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fact_cache (
+    key TEXT PRIMARY KEY,
+    facts TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_fact_cache_last_used_at ON fact_cache (last_used_at);
+"""
+
+
+def normalize_fact_text(text):
+    """Whitespace-insensitive form of the page text, so reflowed markup still hits."""
+    return " ".join((text or "").split())
+
+
+def fact_cache_key(text, model, prompt_version):
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, normalize_fact_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class FactCache:
+    """Persistent cache of extracted company facts.
+
+    Entries expire ttl seconds after they were written. Past max_entries the
+    least recently used rows are dropped on the next write. hits and misses
+    count lookups made by this process.
+    """
+
+    def __init__(self, path=FACT_CACHE_PATH, ttl=FACT_CACHE_TTL, max_entries=FACT_CACHE_MAX_ENTRIES):
+        self.path = path or None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready = True
+        return conn
+
+    def get(self, key):
+        if not self.path:
+            return None
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    row = conn.execute(
+                        "SELECT facts FROM fact_cache WHERE key = ? AND created_at > ?",
+                        (key, now - self.ttl)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE fact_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            finally:
+                conn.close()
+            facts = json.loads(row[0]) if row else None
+        except Exception as e:
+            logging.warning(f"[FACT CACHE] Lookup failed: {e}")
+            facts = None
+
+        with self._lock:
+            if facts is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return facts
+
+    def put(self, key, facts, model, prompt_version):
+        if not self.path:
+            return
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO fact_cache VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, json.dumps(facts), model, prompt_version, now, now)
+                    )
+                    self._evict(conn, now)
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.warning(f"[FACT CACHE] Could not store entry: {e}")
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM fact_cache WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM fact_cache WHERE key IN ("
+            " SELECT key FROM fact_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        entries = 0
+        if self.path:
+            try:
+                conn = self._connect()
+                try:
+                    entries = conn.execute("SELECT COUNT(*) FROM fact_cache").fetchone()[0]
+                finally:
+                    conn.close()
+            except Exception as e:
+                logging.warning(f"[FACT CACHE] Could not count entries: {e}")
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+get_fact_cache = per_process(FactCache)
+
+
+def fact_cache_stats():
+    return get_fact_cache().stats()
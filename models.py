@@ -1,3 +1,4 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -41,3 +42,53 @@ class Prompt(db.Model):
     versions = db.Column(db.Integer, nullable=False, default=1)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ResearchCache(db.Model):
+    __tablename__ = 'research_cache'
+    domain = db.Column(db.String(255), primary_key=True)  # canonical domain, see research_cache.canonical_domain
+    results = db.Column(db.Text, nullable=False)  # JSON from run_ethical_scraper
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class ResearchJob(db.Model):
+    __tablename__ = 'research_jobs'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, returned to the webhook caller
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    stage = db.Column(db.String(40))  # current or last research stage
+    payload = db.Column(db.Text, nullable=False)  # JSON of the validated webhook fields
+    timings = db.Column(db.Text)  # JSON {stage: seconds}
+    result = db.Column(db.Text)  # JSON research results once finished
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "timings": json.loads(self.timings) if self.timings else {},
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+class CrmOutbox(db.Model):
+    __tablename__ = 'crm_outbox'
+    contact_id = db.Column(db.Integer, primary_key=True)  # one pending update per contact, see crm_outbox
+    email = db.Column(db.String(255))
+    groups = db.Column(db.Text, nullable=False, default='[]')  # JSON list of GroupName strings
+    fields = db.Column(db.Text, nullable=False, default='{}')  # JSON {FieldNum: FieldValue}, latest value wins
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every merge
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending or dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # oldest undelivered change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ResearchLease(db.Model):
+    __tablename__ = 'research_leases'
+    domain = db.Column(db.String(255), primary_key=True)  # canonical domain being researched
+    owner = db.Column(db.String(64), nullable=False)  # pid + random suffix of the worker doing it
+    expires_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,150 @@
+import os
+import logging
+
+from bs4 import BeautifulSoup
+
+# auto picks the fastest parser installed: selectolax, then lxml, then html.parser
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "auto")
+
+INVISIBLE_TAGS = ("script", "style", "noscript")
+_SEP = "\x00"  # joins text nodes so they can be split back apart without touching their content
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+
+def available_backends():
+    backends = []
+    if _SelectolaxParser is not None:
+        backends.append("selectolax")
+    if lxml is not None:
+        backends.append("lxml")
+    backends.append("html.parser")
+    return backends
+
+
+def _resolve_backend(backend):
+    backend = backend or HTML_PARSER_BACKEND
+    if backend == "auto":
+        return available_backends()[0]
+    if backend not in available_backends():
+        logging.warning(f"[PARSER] Backend {backend!r} not installed, using html.parser")
+        return "html.parser"
+    return backend
+
+
+class ParsedDocument:
+    """One HTML page parsed once, exposed as read-only views.
+
+    The tree is private to the document. Scripts, styles and noscript are
+    removed at parse time, so no view ever contains them and no caller
+    needs to mutate the tree. Each view is computed on first access and
+    then cached.
+    """
+
+    def __init__(self, html, backend=None):
+        self.backend = _resolve_backend(backend)
+        self._views = {}
+        try:
+            self._parse(html or "")
+        except Exception as e:
+            if self.backend == "html.parser":
+                raise
+            logging.warning(f"[PARSER] {self.backend} failed ({e}), falling back to html.parser")
+            self.backend = "html.parser"
+            self._parse(html or "")
+
+    def _parse(self, html):
+        if self.backend == "selectolax":
+            self._tree = _SelectolaxParser(html)
+            self._tree.strip_tags(list(INVISIBLE_TAGS))
+        elif self.backend == "lxml":
+            if not html.strip():
+                html = "<html></html>"
+            parser = lxml.html.HTMLParser(encoding="utf-8")
+            self._tree = lxml.html.fromstring(html.encode("utf-8"), parser=parser)
+            lxml.etree.strip_elements(self._tree, lxml.etree.Comment, *INVISIBLE_TAGS, with_tail=False)
+        else:
+            self._tree = BeautifulSoup(html, "html.parser")
+            for tag in self._tree(list(INVISIBLE_TAGS)):
+                tag.decompose()
+
+    def _view(self, name, compute):
+        if name not in self._views:
+            self._views[name] = compute()
+        return self._views[name]
+
+    # --- backend primitives ---
+
+    def _find_all(self, tag):
+        if self.backend == "selectolax":
+            return self._tree.css(tag)
+        if self.backend == "lxml":
+            return self._tree.iter(tag)
+        return self._tree.find_all(tag)
+
+    def _node_text(self, node):
+        # Text nodes stripped and joined with no separator, like bs4's get_text(strip=True)
+        if self.backend == "selectolax":
+            return node.text(separator="", strip=True)
+        if self.backend == "lxml":
+            return "".join(s.strip() for s in node.itertext())
+        return node.get_text(strip=True)
+
+    def _all_text_nodes(self):
+        if self.backend == "selectolax":
+            root = self._tree.root
+            return root.text(separator=_SEP).split(_SEP) if root is not None else []
+        if self.backend == "lxml":
+            return list(self._tree.itertext())
+        return list(self._tree.strings)
+
+    def _first_text(self, tag):
+        for node in self._find_all(tag):
+            return self._node_text(node)
+        return None
+
+    # --- views ---
+
+    @property
+    def text_blocks(self):
+        """Stripped, non-empty visible text nodes in document order."""
+        return self._view("text_blocks", lambda: tuple(s.strip() for s in self._all_text_nodes() if s.strip()))
+
+    @property
+    def visible_text(self):
+        return self._view("visible_text", lambda: " ".join(self.text_blocks))
+
+    @property
+    def title(self):
+        return self._view("title", lambda: self._first_text("title"))
+
+    @property
+    def h1(self):
+        return self._view("h1", lambda: self._first_text("h1"))
+
+    @property
+    def paragraphs(self):
+        return self._view("paragraphs", lambda: tuple(self._node_text(p) for p in self._find_all("p")))
+
+    @property
+    def anchors(self):
+        """href of every <a> that has one, in document order."""
+        def compute():
+            if self.backend == "selectolax":
+                return tuple(a.attributes.get("href") for a in self._tree.css("a[href]"))
+            if self.backend == "lxml":
+                return tuple(a.get("href") for a in self._tree.iter("a") if a.get("href") is not None)
+            return tuple(a["href"] for a in self._tree.find_all("a", href=True))
+        return self._view("anchors", compute)
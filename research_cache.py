@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ResearchCache, ResearchLease
+from research_engine import run_ethical_scraper, log_event, StageTimer
+
+RESEARCH_CACHE_TTL = int(os.getenv("RESEARCH_CACHE_TTL", str(24 * 3600)))
+RESEARCH_CACHE_ERROR_TTL = int(os.getenv("RESEARCH_CACHE_ERROR_TTL", "900"))
+# Kept under gunicorn's 60s worker timeout, so a killed worker's lease lapses quickly;
+# a live holder renews it every third of the TTL
+RESEARCH_LEASE_TTL = int(os.getenv("RESEARCH_LEASE_TTL", "30"))
+# Followers wait as long as the leader's run is alive (its Future pending or its lease
+# heartbeated). This is only a backstop against a leader that hangs, well above the
+# 20-60s a research run takes, after which a follower researches the domain itself
+RESEARCH_WAIT_SECONDS = float(os.getenv("RESEARCH_WAIT_SECONDS", "600"))
+RESEARCH_LEASE_POLL = 1.0
+
+
+def canonical_domain(url):
+    """Cache key for a company website: bare lowercase host, no scheme, www., port or path.
+
+    'HTTP://www.Example.com/about/' and 'example.com' both give 'example.com'.
+    """
+    url = (url or "").strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    host = (urlparse(url).hostname or "").rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    return host
+
+
+def get_cached_research(domain, newer_than=None):
+    key = canonical_domain(domain)
+    entry = db.session.get(ResearchCache, key)
+    if entry is None or entry.expires_at <= datetime.utcnow():
+        return None
+    if newer_than is not None and entry.created_at < newer_than:
+        return None
+    return json.loads(entry.results)
+
+
+def store_research(domain, results, aliases=()):
+    """Save results under domain's canonical key and any alias (e.g. the redirect target)."""
+    ttl = RESEARCH_CACHE_ERROR_TTL if "error" in results else RESEARCH_CACHE_TTL
+    now = datetime.utcnow()
+    payload = json.dumps(results)
+    for key in {canonical_domain(d) for d in (domain, *aliases) if d}:
+        if not key:
+            continue
+        db.session.merge(ResearchCache(
+            domain=key,
+            results=payload,
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        ))
+    db.session.commit()
+
+
+# --- Single-flight ---
+
+_in_flight = {}  # canonical domain -> Future for the research running in this process
+_in_flight_lock = threading.Lock()
+
+
+def acquire_research_lease(key, owner):
+    """Claim key for owner across workers; True if no live lease is held by anyone else."""
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=RESEARCH_LEASE_TTL)
+    try:
+        db.session.add(ResearchLease(domain=key, owner=owner, expires_at=expires))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+    # Taken over only once the holder's lease has run out (it crashed or hung)
+    taken = db.session.execute(
+        update(ResearchLease)
+        .where(ResearchLease.domain == key, ResearchLease.expires_at < now)
+        .values(owner=owner, expires_at=expires)
+    ).rowcount
+    db.session.commit()
+    return taken == 1
+
+
+def release_research_lease(key, owner):
+    ResearchLease.query.filter_by(domain=key, owner=owner).delete()
+    db.session.commit()
+
+
+def renew_research_lease(key, owner):
+    expires = datetime.utcnow() + timedelta(seconds=RESEARCH_LEASE_TTL)
+    renewed = ResearchLease.query.filter_by(domain=key, owner=owner).update({"expires_at": expires})
+    db.session.commit()
+    return renewed == 1
+
+
+@contextmanager
+def _lease_heartbeat(key, owner):
+    """Keep owner's lease on key alive while the block runs; it lapses soon after a worker dies."""
+    app = current_app._get_current_object()
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(RESEARCH_LEASE_TTL / 3):
+            with app.app_context():
+                try:
+                    if not renew_research_lease(key, owner):
+                        return
+                except Exception as e:
+                    log_event(f"[RESEARCH CACHE] Could not renew lease on {key}: {e}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=beat, name=f"research-lease-{key}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def _scrape_and_store(domain, key, force_refresh, timer):
+    start = time.time()
+    results = run_ethical_scraper(domain, timer=timer)
+    log_event(f"[RESEARCH CACHE] {'Refreshed' if force_refresh else 'Miss for'} {key} in {time.time() - start:.1f}s")
+    store_research(key, results, aliases=[results.get("resolved_url")])
+    return results
+
+
+def _research_across_workers(domain, key, force_refresh, timer):
+    """Run the scraper for key unless another worker already is; then reuse its result.
+
+    While another worker holds the lease, this one polls the research cache
+    for the result. It takes over only once that worker's lease lapses (the
+    worker died), or after the RESEARCH_WAIT_SECONDS backstop.
+    """
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+    started = datetime.utcnow()
+    deadline = time.time() + RESEARCH_WAIT_SECONDS
+    waited = False
+    while not acquire_research_lease(key, owner):
+        if not waited:
+            log_event(f"[RESEARCH CACHE] {key} is being researched by another worker, waiting")
+            waited = True
+        if time.time() >= deadline:
+            log_event(f"[RESEARCH CACHE] {key} still held after {RESEARCH_WAIT_SECONDS:.0f}s, researching it here")
+            return _scrape_and_store(domain, key, force_refresh, timer)
+        time.sleep(RESEARCH_LEASE_POLL)
+        cached = get_cached_research(key, newer_than=started if force_refresh else None)
+        if cached is not None:
+            log_event(f"[RESEARCH CACHE] Reused another worker's research for {key}")
+            return cached
+
+    try:
+        if waited and not force_refresh:
+            # The previous holder may have stored a result just before letting go
+            cached = get_cached_research(key)
+            if cached is not None:
+                return cached
+        with _lease_heartbeat(key, owner):
+            return _scrape_and_store(domain, key, force_refresh, timer)
+    finally:
+        release_research_lease(key, owner)
+
+
+def research_domain(domain, force_refresh=False, timer=None):
+    """run_ethical_scraper(domain), served from the research cache when fresh.
+
+    Needs an app context. force_refresh skips the lookup and overwrites the entry.
+    timer (a research_engine.StageTimer) is passed through to the scraper.
+    Callers asking for a domain that is already being researched, in this
+    worker or another, wait for that run instead of starting their own.
+    """
+    key = canonical_domain(domain)
+    timer = timer or StageTimer()
+    if not force_refresh:
+        with timer("cache"):
+            cached = get_cached_research(key)
+        if cached is not None:
+            log_event(f"[RESEARCH CACHE] Hit for {key}")
+            return cached
+
+    # Concurrent callers for the same domain share one run: in this process
+    # through a Future, across workers through a lease row
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        log_event(f"[RESEARCH CACHE] Joining in-flight research for {key}")
+        try:
+            with timer("wait"):
+                return future.result(timeout=RESEARCH_WAIT_SECONDS)
+        except FutureTimeout:
+            log_event(f"[RESEARCH CACHE] {key} still in flight after {RESEARCH_WAIT_SECONDS:.0f}s, researching it here")
+            return _scrape_and_store(domain, key, force_refresh, timer)
+
+    try:
+        results = _research_across_workers(domain, key, force_refresh, timer)
+        future.set_result(results)
+        return results
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
@@ -1,18 +1,28 @@
 import os
 import re
 import json
+import zlib
+import heapq
+import itertools
+import xml.etree.ElementTree as ET
 import logging
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
-import requests
-from bs4 import BeautifulSoup
 import urllib.robotparser
-import requests
 import time
 import random
+import threading
+import asyncio
+from types import SimpleNamespace
+from contextlib import contextmanager
 
-from playwright.sync_api import sync_playwright
+import httpx
+
+from playwright.async_api import async_playwright
+
+from background import LoopThread, per_process
+from parsed_document import ParsedDocument
 
 # --- Logging Setup ---
 LOG_DIR = Path("logs")
@@ -37,85 +47,521 @@ def log_blacklisted(domain, reason):
     with open(BLACKLIST_LOG_FILE, "a") as f:
         f.write(f"{domain} blocked: {reason}\n")
 
+# --- Browser Pool ---
+
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "3"))
+BROWSER_RECYCLE_AFTER = int(os.getenv("BROWSER_RECYCLE_AFTER", "100"))
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+
+class BrowserPool:
+    """Long-lived headless Chromium used for Playwright fallback fetches.
+
+    One browser per worker, launched on first use and shared by up to
+    max_pages concurrent contexts. Images, fonts and media are never
+    downloaded. The browser is replaced after recycle_after pages (once it
+    is idle) or as soon as it is found disconnected.
+    """
+
+    def __init__(self, max_pages=BROWSER_MAX_PAGES, recycle_after=BROWSER_RECYCLE_AFTER):
+        self.recycle_after = recycle_after
+        self._slots = asyncio.Semaphore(max_pages)
+        self._launch_lock = asyncio.Lock()
+        self._playwright = None
+        self._browser = None
+        self._active = 0
+        self._pages_served = 0
+
+    async def _acquire(self):
+        async with self._launch_lock:
+            browser = self._browser
+            if browser is not None:
+                if not browser.is_connected():
+                    log_event("[PLAYWRIGHT] Browser disconnected, relaunching")
+                    await self._close_browser()
+                elif self._pages_served >= self.recycle_after and self._active == 0:
+                    log_event(f"[PLAYWRIGHT] Recycling browser after {self._pages_served} pages")
+                    await self._close_browser()
+            if self._browser is None:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                self._pages_served = 0
+            self._active += 1
+            return self._browser
+
+    async def _close_browser(self):
+        browser, self._browser = self._browser, None
+        if browser is not None:
+            try:
+                await browser.close()
+            except Exception as e:
+                log_event(f"[PLAYWRIGHT] Error closing browser: {e}")
+
+    @staticmethod
+    async def _block_heavy_resources(route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def fetch_html(self, url, timeout=10000):
+        async with self._slots:
+            browser = await self._acquire()
+            context = None
+            try:
+                context = await browser.new_context()
+                await context.route("**/*", self._block_heavy_resources)
+                page = await context.new_page()
+                await page.goto(url, timeout=timeout)
+                return await page.content()
+            except Exception as e:
+                log_event(f"[PLAYWRIGHT] Failed to load {url}: {e}")
+                return ""
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+                self._active -= 1
+                self._pages_served += 1
+
+    async def close(self):
+        async with self._launch_lock:
+            await self._close_browser()
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
 def browser_fetch_text(url):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        try:
-            page.goto(url, timeout=10000)
-            return page.content()
-        except Exception as e:
-            log_event(f"[PLAYWRIGHT] Failed to load {url}: {e}")
-            return ""
-        finally:
-            browser.close()
+    engine = get_fetch_engine()
+    return engine.run(engine.browser.fetch_html(url))
 
 
-def safe_get(url, timeout=10, retries=2, use_browser_fallback=True):
-    import random
-    import time
-    from types import SimpleNamespace
-
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
-        "(KHTML, like Gecko) Version/15.1 Safari/605.1.15",
-        "Mozilla/5.0 (Windows NT 10.0; rv:92.0) Gecko/20100101 Firefox/92.0"
-    ]
+# --- Async Fetch Engine ---
+
+MAX_CONCURRENT_FETCHES = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "20"))
+MAX_CONCURRENT_PER_HOST = int(os.getenv("SCRAPER_MAX_PER_HOST", "6"))
+KEEPALIVE_SECONDS = float(os.getenv("SCRAPER_KEEPALIVE_SECONDS", "30"))
+
+# httpx only decodes brotli when one of these packages is importable
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/15.1 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; rv:92.0) Gecko/20100101 Firefox/92.0"
+]
+
 
-    headers = {
-        "User-Agent": random.choice(user_agents),
+def build_request_headers():
+    return {
+        "User-Agent": random.choice(USER_AGENTS),
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
         "Accept-Language": "en-US,en;q=0.5",
+        "Accept-Encoding": ACCEPT_ENCODING,
         "Referer": "https://www.google.com/",
         "Connection": "keep-alive",
         "Upgrade-Insecure-Requests": "1",
     }
 
-    for attempt in range(retries):
-        try:
-            log_event(f"[GET] Attempt {attempt+1} - Fetching {url}")
-            response = requests.get(url, headers=headers, timeout=timeout)
-            if response.status_code == 200:
-                return response
-            elif response.status_code in [403, 404]:
-                log_event(f"[SKIP RETRY] Status {response.status_code} for {url}")
-                return response
-            else:
-                log_event(f"[RETRY] Status {response.status_code} for {url}")
-        except requests.exceptions.ConnectionError as ce:
-            if "Connection reset by peer" in str(ce):
-                log_event(f"[BLOCKED] {url} reset the connection. Aborting early.")
-                return None  # Fail fast
-            log_event(f"[ERROR] Attempt {attempt+1} failed for {url}: {ce}")
-        except Exception as e:
-            log_event(f"[ERROR] Attempt {attempt+1} failed for {url}: {e}")
 
-        time.sleep(min(10, 1.5 ** attempt + random.uniform(0.5, 1.5)))
+class FetchEngine(LoopThread):
+    """asyncio fetch engine running on its own event-loop thread.
+
+    The loop and its httpx client live as long as the worker process, so sync
+    callers can hand it many URLs at once and get them back concurrently,
+    bounded by a global and a per-host concurrency limit.
+
+    The client keeps a pool of keep-alive connections shared by every stage
+    and every research run in the worker. The per-host limit also caps how
+    many pooled connections a single host can hold.
+    """
 
-    if use_browser_fallback:
-        log_event(f"[FALLBACK] Trying Playwright for {url}")
+    thread_name = "fetch-engine"
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_FETCHES, max_per_host=MAX_CONCURRENT_PER_HOST):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self._host_limits = {}
+        self.requests_sent = 0
+        self.connections_opened = 0
+        super().__init__()
+
+    async def _setup(self):
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+            keepalive_expiry=KEEPALIVE_SECONDS,
+        )
+        self._client = httpx.AsyncClient(follow_redirects=True, limits=limits)
+        self._global_limit = asyncio.Semaphore(self.max_concurrency)
+        self.browser = BrowserPool()
+
+    async def _shutdown(self):
+        await self.browser.close()
+        await self._client.aclose()
+
+    async def _trace(self, event_name, info):
+        # httpcore trace hook: one send per request on the wire (redirects
+        # included), one connect per connection the pool had to open
+        if event_name.endswith("send_request_headers.started"):
+            self.requests_sent += 1
+        elif event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+
+    def stats(self):
+        misses = self.connections_opened
+        return {
+            "requests": self.requests_sent,
+            "pool_hits": max(0, self.requests_sent - misses),
+            "pool_misses": misses,
+        }
+
+    def _host_limit(self, host):
+        # Only ever touched from the loop thread, so no lock is needed. Always taken
+        # before _global_limit, so requests queued behind one busy host hold no global slot
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    async def fetch(self, url, timeout=10, retries=2, use_browser_fallback=True):
+        headers = build_request_headers()
+        host = urlparse(url).netloc.lower()
+
+        for attempt in range(retries):
+            try:
+                log_event(f"[GET] Attempt {attempt+1} - Fetching {url}")
+                async with self._host_limit(host), self._global_limit:
+                    response = await self._client.get(
+                        url, headers=headers, timeout=timeout, extensions={"trace": self._trace}
+                    )
+                if response.status_code == 200:
+                    return response
+                elif response.status_code in [403, 404]:
+                    log_event(f"[SKIP RETRY] Status {response.status_code} for {url}")
+                    return response
+                else:
+                    log_event(f"[RETRY] Status {response.status_code} for {url}")
+            except httpx.TransportError as te:
+                if "Connection reset by peer" in str(te):
+                    log_event(f"[BLOCKED] {url} reset the connection. Aborting early.")
+                    return None  # Fail fast
+                log_event(f"[ERROR] Attempt {attempt+1} failed for {url}: {te!r}")
+            except Exception as e:
+                log_event(f"[ERROR] Attempt {attempt+1} failed for {url}: {e}")
+
+            await asyncio.sleep(min(10, 1.5 ** attempt + random.uniform(0.5, 1.5)))
+
+        if use_browser_fallback:
+            log_event(f"[FALLBACK] Trying Playwright for {url}")
+            try:
+                html = await self.browser.fetch_html(url)
+                if html:
+                    return SimpleNamespace(status_code=200, text=html, content=html.encode("utf-8"), url=url)
+            except Exception as e:
+                log_event(f"[FALLBACK ERROR] Playwright failed for {url}: {e}")
+
+        log_event(f"[FAILURE] All attempts failed for {url}")
+        return None
+
+    async def get_once(self, url, timeout=10):
+        """Single GET with no retries, logging or fallback; transport errors propagate."""
+        host = urlparse(url).netloc.lower()
+        async with self._host_limit(host), self._global_limit:
+            return await self._client.get(
+                url, headers=build_request_headers(), timeout=timeout, extensions={"trace": self._trace}
+            )
+
+    async def _stream(self, url, timeout):
+        host = urlparse(url).netloc.lower()
+        async with self._host_limit(host), self._global_limit:
+            async with self._client.stream(
+                "GET", url, headers=build_request_headers(), timeout=timeout, extensions={"trace": self._trace}
+            ) as response:
+                if response.status_code != 200:
+                    log_event(f"[STREAM] Status {response.status_code} for {url}")
+                    return
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+
+    def iter_bytes(self, url, timeout=10):
+        """Sync generator over the body of url, streamed on the engine loop.
+
+        Yields nothing for a non-200 response or a transport error. Each chunk
+        is handed to the caller before the next is read, so memory stays
+        bounded whatever the body size.
+        """
         try:
-            html = browser_fetch_text(url)
-            if html:
-                return SimpleNamespace(status_code=200, text=html, content=html.encode("utf-8"))
+            yield from self.iterate(self._stream(url, timeout))
         except Exception as e:
-            log_event(f"[FALLBACK ERROR] Playwright failed for {url}: {e}")
+            log_event(f"[STREAM] Failed reading {url}: {e!r}")
+
+
+get_fetch_engine = per_process(FetchEngine, on_exit=FetchEngine.close)
+
+
+def safe_get(url, timeout=10, retries=2, use_browser_fallback=True):
+    engine = get_fetch_engine()
+    return engine.run(engine.fetch(url, timeout=timeout, retries=retries, use_browser_fallback=use_browser_fallback))
+
 
-    log_event(f"[FAILURE] All attempts failed for {url}")
-    return None
+def fetch_pool_stats():
+    """Connection-pool hit/miss counters for this worker's fetch engine."""
+    return get_fetch_engine().stats()
 
 
 
+# --- Per-run Page Store ---
+
+# Candidate pages each stage reads; run_ethical_scraper prefetches all of them at once
+LOCATION_PATHS = ["about", "about-us", "contact", "contact-us", "locations"]
+FACT_PATHS = [
+    "",  # homepage
+    "about", "about-us", "company", "overview", "who-we-are",
+    "our-story", "mission", "vision", "contact-us"
+]
+SOCIAL_PATHS = ["about", "contact", "home"]
+
+class PageStore:
+    """Fetch-once page cache shared by every stage of a single research run.
+
+    Each URL is requested through the fetch engine at most once and parsed at
+    most once into a ParsedDocument; every stage reading the same URL sees the
+    same response and the same read-only document.
+    Stages call prefetch() with all their candidate URLs so they download
+    concurrently, then read them back one by one in a deterministic order.
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self._documents = {}
+        self._lock = threading.RLock()
+        self._url_locks = {}
+        self.fetches = 0
+        self.reuses = 0
+
+    @staticmethod
+    def _key(url):
+        parsed = urlparse(url.split("#", 1)[0])
+        return parsed._replace(netloc=parsed.netloc.lower(), path=parsed.path or "/").geturl()
+
+    def _url_lock(self, key):
+        with self._lock:
+            return self._url_locks.setdefault(key, threading.Lock())
+
+    def get(self, url, **kwargs):
+        """Return the response for url, fetching it on first use only.
+
+        Keyword arguments are passed to the fetch engine on the first fetch;
+        later calls for the same URL reuse whatever that fetch produced.
+        """
+        return self._future(url, **kwargs).result()
+
+    def _future(self, url, **kwargs):
+        key = self._key(url)
+        with self._lock:
+            future = self._responses.get(key)
+            if future is not None:
+                self.reuses += 1
+                return future
+            engine = get_fetch_engine()
+            future = self._responses[key] = engine.submit(engine.fetch(url, **kwargs))
+            self.fetches += 1
+            return future
+
+    def prefetch(self, urls, **kwargs):
+        """Start fetching every URL not already in the store, concurrently."""
+        with self._lock:
+            for url in urls:
+                if self._key(url) not in self._responses:
+                    self._future(url, **kwargs)
+
+    def cancel(self, urls):
+        """Cancel fetches for urls that have not completed and forget them; returns how many."""
+        cancelled = 0
+        with self._lock:
+            for url in urls:
+                key = self._key(url)
+                future = self._responses.get(key)
+                if future is not None and future.cancel():
+                    del self._responses[key]
+                    self.fetches -= 1
+                    cancelled += 1
+        return cancelled
+
+    def html(self, url):
+        res = self.get(url)
+        if res and res.status_code == 200:
+            return res.text
+        return ""
+
+    def document(self, url):
+        """ParsedDocument for url, or None if it was not fetched successfully."""
+        key = self._key(url)
+        html = self.html(url)
+        if not html:
+            return None
+        with self._url_lock(key):
+            if key not in self._documents:
+                self._documents[key] = ParsedDocument(html)
+            return self._documents[key]
+
+    def text_blocks(self, url):
+        """Visible text nodes (script/style/noscript excluded), stripped, in document order."""
+        doc = self.document(url)
+        return list(doc.text_blocks) if doc is not None else []
+
+    def visible_text(self, url):
+        """Page text without script/style/noscript content, computed once."""
+        doc = self.document(url)
+        return doc.visible_text if doc is not None else ""
+
+
+# --- robots.txt Cache ---
+
+ROBOTS_TTL_SECONDS = int(os.getenv("ROBOTS_CACHE_TTL", "86400"))
+ROBOTS_NEGATIVE_TTL_SECONDS = int(os.getenv("ROBOTS_CACHE_NEGATIVE_TTL", "3600"))
+ROBOTS_TIMEOUT = float(os.getenv("ROBOTS_TIMEOUT", "5"))
+ROBOTS_CACHE_PATH = os.getenv("ROBOTS_CACHE_PATH")  # optional JSON file shared across restarts
+ROBOTS_SAVE_INTERVAL = 30  # seconds between writes of new entries to ROBOTS_CACHE_PATH
+ROBOTS_MAX_BYTES = 500 * 1024
+ROBOTS_UNREACHABLE = 0  # status recorded when robots.txt could not be fetched at all
+
+
+class RobotsCache:
+    """Per-host robots.txt decisions with a TTL, shared across a worker.
+
+    Only the fetch outcome (status and body) is stored, so every later
+    can_fetch() for the same host, for any URL, is answered from memory.
+    Decisions follow urllib.robotparser: 401/403 disallow everything, other
+    4xx allow everything, 5xx disallow, and an unreachable host is allowed
+    (the scraper's historical behaviour). Anything other than a 200 is kept
+    for the shorter negative TTL. New entries are written to path at most
+    every ROBOTS_SAVE_INTERVAL seconds, and by save() at exit.
+    """
+
+    def __init__(self, ttl=ROBOTS_TTL_SECONDS, negative_ttl=ROBOTS_NEGATIVE_TTL_SECONDS, path=ROBOTS_CACHE_PATH):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = Path(path) if path else None
+        self._entries = {}   # origin -> {"expires": ts, "status": int, "body": str}
+        self._parsers = {}   # origin -> RobotFileParser built from the entry
+        self._lock = threading.Lock()
+        self._origin_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._saved_at = 0.0
+        self._entries = self._read_disk()
+
+    def _read_disk(self):
+        if not self.path or not self.path.exists():
+            return {}
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            log_event(f"[robots.txt] Ignoring unreadable cache {self.path}: {e}")
+            return {}
+        now = time.time()
+        return {origin: e for origin, e in entries.items() if e.get("expires", 0) > now}
+
+    def _save(self):
+        # Called with self._lock held. Other workers may share the file: merge
+        # their unexpired entries in, then swap the dict in one assignment so
+        # readers never see it half-built
+        merged = self._read_disk()
+        merged.update(self._entries)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(merged), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as e:
+            log_event(f"[robots.txt] Could not persist cache to {self.path}: {e}")
+        self._entries = merged
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def save(self):
+        """Write unsaved entries to path now."""
+        with self._lock:
+            if self.path and self._dirty:
+                self._save()
+
+    @staticmethod
+    def _build_parser(robots_url, status, body):
+        rp = urllib.robotparser.RobotFileParser(robots_url)
+        if status in (401, 403):
+            rp.disallow_all = True
+        elif status == ROBOTS_UNREACHABLE or 400 <= status < 500:
+            rp.allow_all = True
+        elif status == 200:
+            rp.parse(body.splitlines())
+        # 5xx: parser never marked as read, so can_fetch() returns False
+        return rp
+
+    def _fetch(self, robots_url):
+        engine = get_fetch_engine()
+        try:
+            res = engine.run(engine.get_once(robots_url, timeout=ROBOTS_TIMEOUT))
+        except Exception as e:
+            log_event(f"[robots.txt] Failed to fetch {robots_url}: {e}")
+            return ROBOTS_UNREACHABLE, ""
+        body = res.text[:ROBOTS_MAX_BYTES] if res.status_code == 200 else ""
+        return res.status_code, body
+
+    def parser_for(self, url):
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc.lower()}"
+        robots_url = f"{origin}/robots.txt"
+
+        with self._lock:
+            origin_lock = self._origin_locks.setdefault(origin, threading.Lock())
+
+        with origin_lock:
+            entry = self._entries.get(origin)
+            if entry and entry["expires"] > time.time():
+                self.hits += 1
+                rp = self._parsers.get(origin)
+                if rp is None:
+                    rp = self._parsers[origin] = self._build_parser(robots_url, entry["status"], entry["body"])
+                return rp
+
+            self.misses += 1
+            status, body = self._fetch(robots_url)
+            ttl = self.ttl if status == 200 else self.negative_ttl
+            with self._lock:
+                self._entries[origin] = {"expires": time.time() + ttl, "status": status, "body": body}
+                self._dirty = True
+                if self.path and time.time() - self._saved_at >= ROBOTS_SAVE_INTERVAL:
+                    self._save()
+            rp = self._parsers[origin] = self._build_parser(robots_url, status, body)
+            return rp
+
+    def can_fetch(self, url, user_agent="*"):
+        return self.parser_for(url).can_fetch(user_agent, url)
+
+
+get_robots_cache = per_process(RobotsCache, on_exit=RobotsCache.save)
+
+
 def is_scraping_allowed(url):
     parsed = urlparse(url)
-    robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-    rp = urllib.robotparser.RobotFileParser()
-    rp.set_url(robots_url)
     try:
-        rp.read()
-        allowed = rp.can_fetch("*", url)
+        allowed = get_robots_cache().can_fetch(url)
         log_event(f"[robots.txt] Can fetch {url}? {allowed}")
         if not allowed:
             reason = "User-agent: * disallowed or root path is blocked"
@@ -125,32 +571,27 @@ def is_scraping_allowed(url):
         log_event(f"[robots.txt] Failed to parse: {e}")
         return True
 
+_PRODUCT_LINK_RE = re.compile(r"(product|store|shop|item)", re.I)
+_BLOG_LINK_RE = re.compile(r"(blog|article|news)", re.I)
+
+
 def score_link(url):
     score = 0
     # Add e-commerce or product-specific patterns
-    if re.search(r"(product|store|shop|item)", url, re.I):
+    if _PRODUCT_LINK_RE.search(url):
         score += 2
     if "product" in url.lower():  # Specific for product URLs
         score += 3
-    if re.search(r"(blog|article|news)", url, re.I):  # Blog-specific patterns
+    if _BLOG_LINK_RE.search(url):  # Blog-specific patterns
         score += 2
     return score
 
-def is_valid_article(soup):
-    text = soup.get_text(" ", strip=True)
-    paragraphs = soup.find_all("p")
-    h1 = soup.find("h1")
-    word_count = sum(len(p.get_text(strip=True).split()) for p in paragraphs)
-    return h1 and len(paragraphs) >= 2 and word_count > 150 and len(text) > 300
-
-def extract_article_data(soup, url):
-    title_tag = soup.find("h1") or soup.title
-    title = title_tag.get_text(strip=True) if title_tag else None
+def extract_article_data(doc, url):
+    title = doc.h1 if doc.h1 is not None else doc.title
     if not title:
         title = "Untitled"
 
-    paragraphs = soup.find_all("p")
-    content = " ".join(p.get_text(strip=True) for p in paragraphs)
+    content = " ".join(doc.paragraphs)
     return {
         "title": title,
         "url": url,
@@ -158,21 +599,130 @@ def extract_article_data(soup, url):
     }
 
 
-def find_links_from_sitemap(domain):
-    sitemap_url = urljoin(domain, "/sitemap.xml")
-    res = safe_get(sitemap_url)
-    
-    # If sitemap is not found or failed to fetch, log and proceed to next step
-    if not res or res.status_code != 200:
-        log_event(f"⚠️ Could not access sitemap.xml at {sitemap_url}")
-        return []
+# --- Sitemap Discovery ---
+
+SITEMAP_MAX_FILES = int(os.getenv("SITEMAP_MAX_FILES", "10"))
+SITEMAP_TOP_LINKS = int(os.getenv("SITEMAP_TOP_LINKS", "50"))
+SITEMAP_MAX_BYTES = 50 * 1024 * 1024  # uncompressed size limit from the sitemaps.org protocol
+
+
+def _gunzip_if_needed(chunks, piece=1024 * 1024):
+    # Gzipped sitemaps (.xml.gz) are served as-is, not via Content-Encoding; detect the magic bytes
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    if first[:2] != b"\x1f\x8b":
+        yield first
+        yield from chunks
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in itertools.chain([first], chunks):
+        # Inflate in bounded pieces so a small compressed chunk cannot balloon in memory
+        data = decompressor.decompress(chunk, piece)
+        while data:
+            yield data
+            data = decompressor.decompress(decompressor.unconsumed_tail, piece) if decompressor.unconsumed_tail else b""
+
+
+def iter_sitemap_entries(chunks, max_bytes=SITEMAP_MAX_BYTES):
+    """Yield (kind, loc, lastmod) from a sitemap byte stream.
+
+    kind is "url" for pages in a <urlset> and "sitemap" for children of a
+    <sitemapindex>. Gzipped bodies (.xml.gz) are detected by their magic
+    bytes. Elements are cleared as soon as they are read, so memory use
+    does not grow with the number of URLs.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    entry = {}
+    depth = 0
+    entry_depth = None  # depth of the <url>/<sitemap> being read
+    total = 0
+
+    for chunk in _gunzip_if_needed(chunks):
+        total += len(chunk)
+        if total > max_bytes:
+            log_event(f"[SITEMAP] Stopping after {max_bytes} bytes")
+            return
+
+        try:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                tag = elem.tag.rsplit("}", 1)[-1]
+                if event == "start":
+                    depth += 1
+                    if entry_depth is None and tag in ("url", "sitemap"):
+                        entry_depth, entry = depth, {}
+                    continue
+                # Only direct children count: image:loc, video:loc etc. sit deeper
+                if tag in ("loc", "lastmod") and entry_depth is not None and depth == entry_depth + 1:
+                    entry[tag] = (elem.text or "").strip()
+                elif tag in ("url", "sitemap") and depth == entry_depth:
+                    if entry.get("loc"):
+                        yield tag, entry["loc"], entry.get("lastmod", "")
+                    entry, entry_depth = {}, None
+                    root.clear()
+                depth -= 1
+        except ET.ParseError as e:
+            log_event(f"[SITEMAP] XML parse error, keeping entries read so far: {e}")
+            return
+
+
+def find_links_from_sitemap(domain, max_links=SITEMAP_TOP_LINKS):
+    """Top max_links likely blog/product URLs across the site's sitemaps.
+
+    Starts from the robots.txt Sitemap: entries plus /sitemap.xml and
+    follows sitemap indexes, reading at most SITEMAP_MAX_FILES files. Links
+    are ranked by score_link, then by <lastmod> (newest first), then by
+    file order. Links robots.txt disallows are skipped.
+    """
+    engine = get_fetch_engine()
+    robots = get_robots_cache()
+    sources = (robots.parser_for(domain).site_maps() or []) + [urljoin(domain, "/sitemap.xml")]
+    queue = list(dict.fromkeys(sources))
+    seen = set(queue)
+    top = []  # min-heap of (score, lastmod, -position, url)
+    position = 0
+    files_read = 0
+
+    while queue and files_read < SITEMAP_MAX_FILES:
+        sitemap_url = queue.pop(0)
+        files_read += 1
+        children = []
+        url_count = 0
+        for kind, loc, lastmod in iter_sitemap_entries(engine.iter_bytes(sitemap_url)):
+            if kind == "sitemap":
+                children.append((score_link(loc), lastmod, loc))
+                continue
+            url_count += 1
+            score = score_link(loc)
+            if score <= 0 or loc.endswith(".xml"):
+                continue
+            position += 1
+            item = (score, lastmod, -position, loc)
+            if len(top) >= max_links and item <= top[0]:
+                continue
+            # Only links that would make the cut pay for the robots.txt check
+            if not robots.can_fetch(loc):
+                continue
+            if len(top) < max_links:
+                heapq.heappush(top, item)
+            else:
+                heapq.heapreplace(top, item)
+
+        if url_count or children:
+            log_event(f"Found {url_count} URLs and {len(children)} nested sitemaps in {sitemap_url}")
+        else:
+            log_event(f"⚠️ Could not access or parse sitemap at {sitemap_url}")
 
-    # If we successfully fetch the sitemap, try to find blog links
-    soup = BeautifulSoup(res.content, "xml")
-    all_locs = [loc.get_text() for loc in soup.find_all("loc")]
-    log_event(f"Found {len(all_locs)} URLs in the sitemap")
+        # Most relevant, most recently updated child sitemaps first
+        for _, _, loc in sorted(children, reverse=True):
+            if loc not in seen:
+                seen.add(loc)
+                queue.append(loc)
 
-    blog_links = [link for link in all_locs if score_link(link) > 0 and not link.endswith(".xml")]
+    blog_links = [loc for *_, loc in sorted(top, reverse=True)]
     log_event(f"Identified {len(blog_links)} potential blog links.")
 
     if not blog_links:
@@ -180,58 +730,137 @@ def find_links_from_sitemap(domain):
     return blog_links
 
 
-def deduplicate_locations(locations):
-    seen = set()
+# --- Location Deduplication ---
+
+LOCATION_ALIASES = {
+    "us": "united states",
+    "usa": "united states",
+    "u.s.": "united states",
+    "u.s.a.": "united states",
+    "the united states": "united states"
+}
+
+# Words NER or the fact model report as places that are not useful locations
+LOCATION_BLACKLIST = {"organic", "international", "headquarters", "hq", "global", "warehouse", "warehouses", "ai", "us"}
+
+
+def normalize_location_name(name):
+    return LOCATION_ALIASES.get(name.lower().strip(), name.strip().lower())
+
+
+def deduplicate_locations(locations, blacklist=()):
+    """Keep the longest spelling of each place.
+
+    Locations are visited longest first. One is dropped when its normalised
+    name is blacklisted or is a substring of a name already kept.
+    ("York" goes if "New York" was kept.)
+
+    Every substring of each kept name is indexed, but only at the lengths
+    some candidate actually has. The containment test is then a set lookup
+    instead of a scan over everything kept so far.
+    """
+    norms = {loc: normalize_location_name(loc) for loc in locations}
+    lengths = {len(norm) for norm in norms.values()}
+    kept_substrings = set()
     final = []
     for loc in sorted(locations, key=lambda x: (-len(x), x)):
-        norm = loc.lower().strip()
-        if not any(norm in s.lower() or s.lower() in norm for s in seen):
-            seen.add(loc)
-            final.append(loc)
+        norm = norms[loc]
+        if norm in blacklist or norm in kept_substrings:
+            continue
+        final.append(loc)
+        for size in lengths:
+            for start in range(len(norm) - size + 1):
+                kept_substrings.add(norm[start:start + size])
     return final
 
 
 from urllib.parse import urljoin, urlparse
 
-def extract_social_media_links(base_url: str) -> dict:
-    social_links = {}
-    patterns = {
-        "LinkedIn": r"(https?://(www\.)?linkedin\.com/company/[^\s\"']+)",
-        "Twitter": r"(https?://(www\.)?twitter\.com/[^\s\"']+)",
-        "Facebook": r"(https?://(www\.)?facebook\.com/[^\s\"']+)",
-        "Instagram": r"(https?://(www\.)?instagram\.com/[^\s\"']+)",
-        "YouTube": r"(https?://(www\.)?youtube\.com/[^\s\"']+)"
-    }
-
-    def domain_matches_social(profile_url, target_url):
-        try:
-            profile_slug = urlparse(profile_url).path.lower().strip("/").split("/")[-1]
-            target_domain = urlparse(target_url).netloc.lower().replace("www.", "")
-            domain_base = target_domain.split(".")[0]  # 'salesdrip.com' → 'salesdrip'
-
-            return domain_base in profile_slug or domain_base in profile_url.lower()
-        except Exception as e:
-            log_event(f"[DOMAIN MATCH FAIL] {e}")
-            return True  # fallback to permissive match
+# One pass over the raw HTML finds every platform; group 1 names the platform
+SOCIAL_PROFILE_RE = re.compile(
+    r"https?://(?:www\.)?(linkedin\.com/company|twitter\.com|facebook\.com|instagram\.com|youtube\.com)"
+    r"/[^\s\"'<>\\]+",
+    re.I
+)
+SOCIAL_PLATFORMS = {
+    "linkedin.com": "LinkedIn",
+    "twitter.com": "Twitter",
+    "facebook.com": "Facebook",
+    "instagram.com": "Instagram",
+    "youtube.com": "YouTube",
+}
+# Share buttons and embeds point at the platform, not at the company's profile.
+# Matched against the whole first path segment (minus any .php), so profiles
+# like twitter.com/sharecare are kept
+SOCIAL_SHARE_SEGMENTS = {"sharer", "share", "intent", "plugins", "dialog", "embed"}
+
+
+def social_match_score(profile_url, domain_base):
+    """How well a profile URL matches the company: 3 exact slug, 2 slug contains, 1 URL contains, 0 none."""
+    slug = urlparse(profile_url).path.lower().strip("/").split("/")[-1]
+    if slug == domain_base:
+        return 3
+    if domain_base in slug:
+        return 2
+    if domain_base in profile_url.lower():
+        return 1
+    return 0
+
+
+def extract_social_profiles(base_url: str, pages=None) -> dict:
+    """Every social profile linked from the common pages, ranked per platform.
+
+    Returns {platform: [{"url", "score", "count"}, ...]} ordered by match
+    score, then by how often the profile is linked, then by first
+    appearance.
+    """
+    pages = pages or PageStore()
+    domain_base = urlparse(base_url).netloc.lower().replace("www.", "").split(".")[0]  # 'salesdrip.com' → 'salesdrip'
 
     urls_to_check = [base_url]
-    for suffix in ["about", "contact", "home"]:
+    for suffix in SOCIAL_PATHS:
         urls_to_check.append(urljoin(base_url, suffix))
+    pages.prefetch(urls_to_check)
 
+    found = {}  # normalised url -> candidate, insertion order = first appearance
     for page_url in urls_to_check:
-        res = safe_get(page_url)
-        if res and res.status_code == 200:
-            soup = BeautifulSoup(res.text, "html.parser")
-            html = soup.prettify()
-            for platform, regex in patterns.items():
-                match = re.search(regex, html, re.I)
-                if match and platform not in social_links:
-                    profile = match.group(1)
-                    if domain_matches_social(profile, base_url):
-                        social_links[platform] = profile
-        else:
+        html = pages.html(page_url)
+        if not html:
             log_event(f"[SOCIAL] Could not fetch {page_url}")
+            continue
+        for match in SOCIAL_PROFILE_RE.finditer(html):
+            profile = match.group(0).rstrip(".,;)")
+            path = urlparse(profile).path.lower().strip("/")
+            if path.split("/", 1)[0].split(".", 1)[0] in SOCIAL_SHARE_SEGMENTS:
+                continue
+            key = profile.lower().rstrip("/")
+            candidate = found.get(key)
+            if candidate is None:
+                platform = SOCIAL_PLATFORMS[match.group(1).lower().split("/")[0]]
+                candidate = found[key] = {
+                    "platform": platform,
+                    "url": profile,
+                    "score": social_match_score(profile, domain_base),
+                    "count": 0,
+                }
+            candidate["count"] += 1
+
+    ranked = {}
+    for order, candidate in enumerate(found.values()):
+        ranked.setdefault(candidate.pop("platform"), []).append((candidate, order))
+    return {
+        platform: [c for c, _ in sorted(items, key=lambda item: (-item[0]["score"], -item[0]["count"], item[1]))]
+        for platform, items in ranked.items()
+    }
 
+
+def extract_social_media_links(base_url: str, pages=None) -> dict:
+    """Best-matching profile per platform; platforms with no domain match are left out."""
+    social_links = {
+        platform: candidates[0]["url"]
+        for platform, candidates in extract_social_profiles(base_url, pages=pages).items()
+        if candidates[0]["score"] > 0
+    }
     log_event(f"[SOCIAL MEDIA FOUND] {social_links}")
     return social_links
 
@@ -239,64 +868,148 @@ def extract_social_media_links(base_url: str) -> dict:
 
 # --- Update inside extract_locations_from_main_pages() ---
 
+# --- Location NER ---
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+NER_MAX_CHARS_PER_PAGE = int(os.getenv("NER_MAX_CHARS_PER_PAGE", "20000"))
+NER_MAX_CHARS = int(os.getenv("NER_MAX_CHARS", "100000"))
+NER_CHUNK_CHARS = 2000
+NER_BATCH_SIZE = 16
+# Components that only feed tagging/parsing/lemmas; NER needs none of them
+NER_EXCLUDED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter", "morphologizer"]
+# A GPE mention needs at least one capitalised word
+_MAY_CONTAIN_PLACE = re.compile(r"\b[A-Z][a-zA-Z]")
+
 _nlp = None
+_nlp_lock = threading.Lock()
 
-def extract_locations_from_main_pages(base_url):
+
+def get_ner_pipeline():
+    """spaCy pipeline trimmed to NER, loaded once per process."""
     global _nlp
-    if _nlp is None:
-        import spacy
-        _nlp = spacy.load("en_core_web_sm")
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            nlp = spacy.load(SPACY_MODEL, exclude=NER_EXCLUDED_PIPES)
+            if "tok2vec" in nlp.pipe_names and not getattr(nlp.get_pipe("tok2vec"), "listening_components", []):
+                # The small English model's NER embeds its own tokens; the shared tok2vec is dead weight
+                nlp.remove_pipe("tok2vec")
+            log_event(f"[NER] Loaded {SPACY_MODEL} with pipes {nlp.pipe_names}")
+            _nlp = nlp
+        return _nlp
+
+
+def ner_chunks(page_blocks, max_chars_per_page=NER_MAX_CHARS_PER_PAGE, max_chars=NER_MAX_CHARS):
+    """Group each page's text blocks into NER-sized chunks.
+
+    Blocks that cannot hold a place name are dropped, each page is capped at
+    max_chars_per_page, and the whole run at max_chars. Chunks never span
+    two pages.
+    """
+    chunks = []
+    total = 0
+    for blocks in page_blocks:
+        page_chars = 0
+        current = []
+        current_len = 0
+        for block in blocks:
+            if not _MAY_CONTAIN_PLACE.search(block):
+                continue
+            remaining = min(max_chars_per_page - page_chars, max_chars - total)
+            if remaining <= 0:
+                break
+            block = block[:remaining]
+            if current and current_len + len(block) > NER_CHUNK_CHARS:
+                chunks.append("\n".join(current))
+                current, current_len = [], 0
+            current.append(block)
+            current_len += len(block) + 1
+            page_chars += len(block)
+            total += len(block)
+        if current:
+            chunks.append("\n".join(current))
+        if total >= max_chars:
+            break
+    return chunks
 
-    pages = [base_url.rstrip("/")]
-    for suffix in ["about", "about-us", "contact", "contact-us", "locations"]:
-        pages.append(urljoin(base_url, suffix))
 
-    combined_text = ""
-    for page_url in pages:
-        res = safe_get(page_url)
-        if res and res.status_code == 200:
-            soup = BeautifulSoup(res.text, "html.parser")
-            for tag in soup(["script", "style", "noscript"]):
-                tag.decompose()
-            visible_text = soup.get_text(separator=" ", strip=True)
-            log_event(f"[PAGE TEXT] {page_url} --> {visible_text[:500]}...")
-            combined_text += visible_text + " "
+def extract_gpe_entities(page_blocks):
+    """GPE mentions (<= 40 chars) from lists of per-page text blocks, in page order."""
+    chunks = ner_chunks(page_blocks)
+    if not chunks:
+        return []
+    nlp = get_ner_pipeline()
+    return [
+        ent.text.strip()
+        for doc in nlp.pipe(chunks, batch_size=NER_BATCH_SIZE)
+        for ent in doc.ents
+        if ent.label_ == "GPE" and len(ent.text) <= 40
+    ]
+
+
+def extract_locations_from_main_pages(base_url, pages=None):
+    pages = pages or PageStore()
+
+    page_urls = [base_url.rstrip("/")]
+    for suffix in LOCATION_PATHS:
+        page_urls.append(urljoin(base_url, suffix))
+    pages.prefetch(page_urls)
+
+    page_blocks = []
+    for page_url in page_urls:
+        blocks = pages.text_blocks(page_url)
+        if blocks:
+            log_event(f"[PAGE TEXT] {page_url} --> {' '.join(blocks)[:500]}...")
+            page_blocks.append(blocks)
         else:
             log_event(f"[SKIP] {page_url} not fetched.")
 
-    doc = _nlp(combined_text)
-    all_locs = [ent.text.strip() for ent in doc.ents if ent.label_ == "GPE" and len(ent.text) <= 40]
+    all_locs = extract_gpe_entities(page_blocks)
     deduped = deduplicate_locations(all_locs)
     log_event(f"[EXTRACTED LOCATIONS] {deduped}")
     return deduped
 
-def is_valid_article(soup):
-    text = soup.get_text(" ", strip=True)
-    paragraphs = soup.find_all("p")
-    h1 = soup.find("h1")
-    word_count = sum(len(p.get_text(strip=True).split()) for p in paragraphs)
+def is_valid_article(doc):
+    text = doc.visible_text
+    paragraphs = doc.paragraphs
+    h1 = doc.h1
+    word_count = sum(len(p.split()) for p in paragraphs)
 
-    if not h1 or len(paragraphs) < 2 or word_count < 150 or len(text) < 300:
+    if h1 is None or len(paragraphs) < 2 or word_count < 150 or len(text) < 300:
         return False
 
     bad_phrases = ["sitemap", "login", "privacy", "terms", "faq"]
-    title = (h1.get_text(strip=True).lower() if h1 else "").lower()
+    title = h1.lower()
     if any(phrase in title for phrase in bad_phrases):
         return False
 
     return True
 
-def extract_article_summaries(urls, max_articles=5):
+ARTICLE_FETCH_CONCURRENCY = int(os.getenv("ARTICLE_FETCH_CONCURRENCY", "4"))
+
+
+def extract_article_summaries(urls, max_articles=5, pages=None, concurrency=ARTICLE_FETCH_CONCURRENCY):
+    """First max_articles valid articles among urls, in the order given.
+
+    Up to `concurrency` candidates ahead of the one being checked are
+    fetched in the background. Results are still consumed in rank order, so
+    the output is the same as a one-by-one scan. Fetches still in flight when
+    enough articles are found are cancelled.
+    """
+    pages = pages or PageStore()
+    urls = list(urls)
     summaries = []
-    for url in urls:
+    consumed = 0
+    for i, url in enumerate(urls):
         if len(summaries) >= max_articles:
             break
 
-        res = safe_get(url)
-        if res and res.status_code == 200:
-            soup = BeautifulSoup(res.text, "html.parser")
-            if is_valid_article(soup):
-                article = extract_article_data(soup, url)
+        pages.prefetch(urls[i:i + concurrency])
+        consumed = i + 1
+        doc = pages.document(url)
+        if doc is not None:
+            if is_valid_article(doc):
+                article = extract_article_data(doc, url)
 
                 # Sanitize title
                 title = article["title"].strip() if article["title"] else ""
@@ -317,31 +1030,71 @@ def extract_article_summaries(urls, max_articles=5):
                 log_event(f"[BLOG] Skipped non-article: {url}")
         else:
             log_event(f"[BLOG] Failed to fetch: {url}")
+
+    cancelled = pages.cancel(urls[consumed:consumed + concurrency])
+    if cancelled:
+        log_event(f"[BLOG] Cancelled {cancelled} outstanding article fetches")
     return summaries
 
-def run_ethical_scraper(domain, max_articles=5):
+class StageTimer:
+    """Wall-clock seconds per named stage of a research run.
+
+    on_stage(stage, timings) is called as each stage starts, so a caller
+    (e.g. a background job) can report progress while the run is going.
+    """
+
+    def __init__(self, on_stage=None):
+        self.on_stage = on_stage
+        self.timings = {}
+
+    @contextmanager
+    def __call__(self, stage):
+        if self.on_stage:
+            self.on_stage(stage, dict(self.timings))
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round(time.time() - start, 2)
+
+
+def run_ethical_scraper(domain, max_articles=5, timer=None):
     log_event(f"📡 Starting research for: {domain}")
+    timer = timer or StageTimer()
 
-    if not is_scraping_allowed(domain):
+    with timer("robots"):
+        allowed = is_scraping_allowed(domain)
+    if not allowed:
         return {"error": "Scraping disallowed by robots.txt."}
 
+    # One page store per run so every stage shares the same fetched pages
+    pages = PageStore()
+
     # Check homepage availability first
-    homepage_res = safe_get(domain, retries=2, use_browser_fallback=False)
+    with timer("homepage"):
+        homepage_res = pages.get(domain, retries=2, use_browser_fallback=False)
     if not homepage_res or homepage_res.status_code != 200:
         log_event(f"❌ Aborting: Homepage {domain} is unreachable or blocked.")
         log_blacklisted(urlparse(domain).netloc, "Homepage unreachable or connection reset")
         return {"error": "Domain blocked or unreachable. Aborted early."}
 
+    # Fetch every candidate page for all stages concurrently
+    base = domain.rstrip("/") + "/"
+    pages.prefetch([urljoin(base, path) for path in LOCATION_PATHS + FACT_PATHS + SOCIAL_PATHS])
+
     # Proceed to sitemap scan
-    blog_links = find_links_from_sitemap(domain)
+    with timer("sitemap"):
+        blog_links = find_links_from_sitemap(domain)
     if not blog_links:
         log_event(f"⚠️ No blog links found. Moving on to scrape homepage for location information.")
 
     # Extract location mentions from main pages
-    locations = extract_locations_from_main_pages(domain)
+    with timer("locations"):
+        locations = extract_locations_from_main_pages(domain, pages=pages)
 
     # Extract company facts and products from homepage
-    company_facts = extract_company_facts_from_domain(domain)
+    with timer("company_facts"):
+        company_facts = extract_company_facts_from_domain(domain, pages=pages)
     if not company_facts:
         log_event(f"❌ No company facts found.")
         company_facts = {
@@ -350,10 +1103,19 @@ def run_ethical_scraper(domain, max_articles=5):
         }
 
     # Extract social media links from common pages
-    social = extract_social_media_links(domain)
+    with timer("social"):
+        social = extract_social_media_links(domain, pages=pages)
+
+    with timer("articles"):
+        articles = extract_article_summaries(blog_links, max_articles=max_articles, pages=pages)
+    log_event(f"[PAGES] {pages.fetches} fetched, {pages.reuses} reused for {domain}")
+    log_event(f"[POOL] {fetch_pool_stats()}")
+    log_event(f"[FACT CACHE] {fact_cache_stats()}")
+    log_event(f"[TIMINGS] {domain} {timer.timings}")
 
     return {
-        "articles": extract_article_summaries(blog_links, max_articles=5),
+        "resolved_url": str(getattr(homepage_res, "url", domain)),
+        "articles": articles,
         "locations": "; ".join(locations),
         "company_facts": company_facts.get("company_facts", {}),
         "products_services": company_facts.get("products_services", {}),
@@ -373,11 +1135,15 @@ if __name__ == "__main__":
 
 # --- AI Company Fact Extraction ---
 from openai import OpenAI
+from fact_cache import get_fact_cache, fact_cache_key, fact_cache_stats
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("❌ OPENAI_API_KEY not set in environment.")
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+FACT_MODEL = "gpt-4o"
+FACT_PROMPT_VERSION = "1"  # bump whenever the prompt below changes so cached facts are not reused
+
 
 def extract_company_facts_from_text(raw_text: str) -> dict:
     import ast
@@ -433,9 +1199,20 @@ Here is the company text:
 
     prompt = prompt_template.format(raw_text=raw_text)
 
+    cache = get_fact_cache()
+    cache_key = fact_cache_key(raw_text, FACT_MODEL, FACT_PROMPT_VERSION)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        log_event(f"[FACT CACHE] Hit {cache_key[:12]} ({cache.hits} hits / {cache.misses} misses)")
+        return cached
+
+    def remember(parsed):
+        cache.put(cache_key, parsed, FACT_MODEL, FACT_PROMPT_VERSION)
+        return parsed
+
     try:
         response = client.chat.completions.create(
-            model="gpt-4o",
+            model=FACT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.4,
             max_tokens=1500
@@ -448,7 +1225,7 @@ Here is the company text:
 
         parsed = try_parsing(sanitized)
         if parsed:
-            return parsed
+            return remember(parsed)
 
         # 🔁 If failed, try truncating to last full closing brace
         last_brace = sanitized.rfind("}")
@@ -457,7 +1234,7 @@ Here is the company text:
             parsed = try_parsing(truncated)
             if parsed:
                 log_event("[AI RECOVERY] Parsed with truncated closing brace.")
-                return parsed
+                return remember(parsed)
 
         log_event("[AI PARSE FAIL] Still invalid after cleanup/truncation.")
         return {}
@@ -467,58 +1244,117 @@ Here is the company text:
         return {}
 
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+# --- Fact Text Preprocessing ---
+
+FACT_TOKEN_BUDGET = int(os.getenv("FACT_TOKEN_BUDGET", "6000"))
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_fact_encoding = None
 
-def extract_company_facts_from_domain(url: str) -> dict:
-    def get_html_from_url(u: str) -> str:
+
+def count_tokens(text: str) -> int:
+    """Tokens in text for FACT_MODEL; roughly 4 chars per token when tiktoken is unavailable."""
+    global _fact_encoding
+    if tiktoken is not None and _fact_encoding is None:
+        try:
+            _fact_encoding = tiktoken.encoding_for_model(FACT_MODEL)
+        except Exception:
+            try:
+                _fact_encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                log_event(f"[TOKENS] tiktoken unusable ({e}), estimating from length")
+                _fact_encoding = False
+    if _fact_encoding:
+        return len(_fact_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def strip_boilerplate(page_blocks):
+    """Drop text blocks repeated across a site's pages (nav, footer, cookie banner).
+
+    page_blocks is a list of text-block lists, one per page. Blocks are
+    compared case- and whitespace-insensitively, and each is kept only where
+    it first appears, so a footer address still reaches the model once.
+    """
+    seen = set()
+    cleaned = []
+    for blocks in page_blocks:
+        kept = []
+        for block in blocks:
+            key = " ".join(block.lower().split())
+            if key not in seen:
+                seen.add(key)
+                kept.append(block)
+        cleaned.append(kept)
+    return cleaned
+
+
+def trim_to_token_budget(page_blocks, budget=FACT_TOKEN_BUDGET):
+    """Keep each page's blocks, in order, while the total stays within budget tokens.
+
+    The budget is shared out page by page; whatever a short page leaves
+    unused carries over to the pages after it.
+    """
+    remaining = budget
+    trimmed = []
+    for i, blocks in enumerate(page_blocks):
+        share = remaining // (len(page_blocks) - i)
+        used = 0
+        kept = []
+        for block in blocks:
+            cost = count_tokens(block) + 1  # +1 for the newline joining blocks
+            if used + cost > share:
+                continue  # a smaller block further down may still fit
+            kept.append(block)
+            used += cost
+        remaining -= used
+        trimmed.append(kept)
+    return trimmed
+
+
+def extract_company_facts_from_domain(url: str, pages=None) -> dict:
+    pages = pages or PageStore()
+
+    def get_text_blocks(u: str) -> list:
         try:
-            headers = {"User-Agent": "Mozilla/5.0"}
-            res = requests.get(u, headers=headers, timeout=10)
-            if res.status_code == 200:
-                return res.text
+            return pages.text_blocks(u)
         except Exception as e:
             log_event(f"❌ Failed to get HTML from {u}: {e}")
-        return ""
+        return []
 
-    def extract_visible_text(html: str) -> str:
-        soup = BeautifulSoup(html, "html.parser")
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        return soup.get_text(separator=" ", strip=True)
+    domain = url.rstrip("/")
+    full_urls = [urljoin(domain + "/", path) for path in FACT_PATHS]
+    pages.prefetch(full_urls)
 
-    relevant_paths = [
-        "",  # homepage
-        "about", "about-us", "company", "overview", "who-we-are", 
-        "our-story", "mission", "vision", "contact-us"
-    ]
+    page_blocks = []
 
-    domain = url.rstrip("/")
-    full_urls = [urljoin(domain + "/", path) for path in relevant_paths]
-
-    combined_text = ""
-    successful_pages = 0
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_url = {executor.submit(get_html_from_url, u): u for u in full_urls}
-
-        for future in as_completed(future_to_url):
-            page_url = future_to_url[future]
-            html = future.result()
-            if html:
-                visible = extract_visible_text(html)
-                if visible.strip():
-                    log_event(f"[FACT SCRAPE] ✅ {page_url} ({len(visible)} chars)")
-                    combined_text += visible + "\n\n"
-                    successful_pages += 1
-                else:
-                    log_event(f"[FACT SCRAPE] ⚠️ {page_url} had no visible text.")
+    for page_url in full_urls:
+        if pages.html(page_url):
+            blocks = get_text_blocks(page_url)
+            if blocks:
+                log_event(f"[FACT SCRAPE] ✅ {page_url} ({sum(len(b) for b in blocks)} chars)")
+                page_blocks.append(blocks)
             else:
-                log_event(f"[FACT SCRAPE] ❌ Failed to fetch {page_url}")
+                log_event(f"[FACT SCRAPE] ⚠️ {page_url} had no visible text.")
+        else:
+            log_event(f"[FACT SCRAPE] ❌ Failed to fetch {page_url}")
 
-    if not combined_text.strip():
+    if not page_blocks:
         log_event(f"❌ No usable content extracted from any company-related pages.")
         return {}
 
+    raw_chars = sum(len(b) for blocks in page_blocks for b in blocks)
+    page_blocks = trim_to_token_budget(strip_boilerplate(page_blocks))
+    combined_text = "\n\n".join("\n".join(blocks) for blocks in page_blocks if blocks)
+    log_event(
+        f"[FACT SCRAPE] {len(page_blocks)} pages, {raw_chars} chars -> {len(combined_text)} chars, "
+        f"~{count_tokens(combined_text)} tokens (budget {FACT_TOKEN_BUDGET})"
+    )
+
     return extract_company_facts_from_text(combined_text)
 
 
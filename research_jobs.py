@@ -0,0 +1,79 @@
+import os
+import json
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from background import per_process
+from models import db, ResearchJob
+from research_cache import research_domain
+from research_engine import StageTimer
+from salesdrip_export import research_payload_from_results
+from crm_outbox import queue_research_to_crm
+
+RESEARCH_JOB_WORKERS = int(os.getenv("RESEARCH_JOB_WORKERS", "2"))
+
+_get_executor = per_process(
+    lambda: ThreadPoolExecutor(max_workers=RESEARCH_JOB_WORKERS, thread_name_prefix="research-job")
+)
+
+
+def research_and_save(domain, company_name, email, contact_id, force_refresh=False, timer=None):
+    """Research domain and write the results to the contact's CRM fields.
+
+    Shared by the synchronous webhook and background jobs.
+    """
+    timer = timer or StageTimer()
+    results = research_domain(domain, force_refresh=force_refresh, timer=timer)
+    with timer("crm"):
+        queue_research_to_crm(email, company_name, research_payload_from_results(results), contact_id=contact_id)
+    return results
+
+
+def enqueue_research_job(app, payload):
+    """Record a queued job for payload and hand it to the worker pool; returns the job id."""
+    job = ResearchJob(id=uuid.uuid4().hex, status="queued", payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+    _get_executor().submit(_run_job, app, job.id)
+    logging.info(f"📥 Queued research job {job.id} for {payload.get('domain')}")
+    return job.id
+
+
+def get_research_job(job_id):
+    return db.session.get(ResearchJob, job_id)
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(ResearchJob, job_id)
+        if job is None:
+            logging.error(f"[JOB] Research job {job_id} vanished before it ran")
+            return
+
+        def report(stage, timings):
+            job.stage = stage
+            job.timings = json.dumps(timings)
+            db.session.commit()
+
+        job.status = "running"
+        db.session.commit()
+        payload = json.loads(job.payload)
+        timer = StageTimer(on_stage=report)
+        try:
+            results = research_and_save(
+                payload["domain"], payload["company_name"], payload["email"], payload["contact_id"],
+                force_refresh=payload.get("force_refresh", False), timer=timer
+            )
+            job.result = json.dumps(results)
+            job.error = results.get("error")
+            job.status = "failed" if job.error else "done"
+        except Exception as e:
+            logging.exception(f"🔥 Research job {job_id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.stage = "finished"
+            job.timings = json.dumps(timer.timings)
+            db.session.commit()
+            db.session.remove()
@@ -1,30 +1,64 @@
 import os
-import requests
+import time
+import random
 import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from background import per_process
 
 GREENROPE_ACCOUNT = os.getenv("GREENROPE_ACCOUNT_ID")
-greenrope_token = None
+GREENROPE_API_URL = os.getenv("GREENROPE_API_URL", "https://api.stgi.net/v2/api")
+GREENROPE_TOKEN_TTL = int(os.getenv("GREENROPE_TOKEN_TTL", "3600"))  # used when login gives no expiry
+GREENROPE_TOKEN_REFRESH_MARGIN = 60
+GREENROPE_MAX_RETRIES = int(os.getenv("GREENROPE_MAX_RETRIES", "3"))
+GREENROPE_POOL_SIZE = int(os.getenv("GREENROPE_POOL_SIZE", "10"))
+GREENROPE_TIMEOUT = (10, 45)  # 10s connect timeout, 45s read timeout
+GREENROPE_RETRY_READ_TIMEOUT = 15  # read timeout for retries, so they fit the budget
+GREENROPE_CALL_BUDGET = float(os.getenv("GREENROPE_CALL_BUDGET", "40"))  # seconds for a call, retries included
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def get_greenrope_token():
-    global greenrope_token
-    if greenrope_token:
-        return greenrope_token
-
-    url = "https://api.stgi.net/v2/api/login"
-    payload = {
-        "Email": os.getenv("GREENROPE_EMAIL"),
-        "Password": os.getenv("GREENROPE_PASSWORD"),
-        "ExpiryMinutes": 0,
-        "ExcludeLoginData": False
-    }
-
-    try:
-        response = requests.post(url, json=payload, timeout=10)
-        logging.info(f"[DEBUG] Login response status: {response.status_code}")
 
-        with open("/tmp/greenrope_login_response.txt", "w", encoding="utf-8") as f:
-            f.write(response.text)
+class GreenRopeClient:
+    """GreenRope API client shared by every thread in a worker.
+
+    Requests go through one keep-alive requests.Session. The access token is
+    cached until shortly before it expires. Only one thread logs in at a
+    time, and the others wait for its token. A 401 drops the token and the
+    call is retried once with a fresh one. 429 and 5xx responses, and
+    connection errors, are retried with exponential backoff. Each call,
+    retries included, ends within GREENROPE_CALL_BUDGET seconds. stats()
+    reports call counts and latency per endpoint.
+    """
 
+    def __init__(self, base_url=GREENROPE_API_URL, account_id=GREENROPE_ACCOUNT,
+                 max_retries=GREENROPE_MAX_RETRIES, pool_size=GREENROPE_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.account_id = account_id
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._token_expires = 0
+        self._token_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    # --- auth ---
+
+    def _login(self):
+        payload = {
+            "Email": os.getenv("GREENROPE_EMAIL"),
+            "Password": os.getenv("GREENROPE_PASSWORD"),
+            "ExpiryMinutes": 0,
+            "ExcludeLoginData": False
+        }
+        response = self._send("POST", "/login", json=payload, timeout=10)
+        logging.info(f"[DEBUG] Login response status: {response.status_code}")
         response.raise_for_status()
         json_data = response.json()
 
@@ -32,10 +66,119 @@ def get_greenrope_token():
             logging.error(f"[ERROR] Unexpected login format: {json_data}")
             raise Exception("AccessToken missing")
 
-        greenrope_token = json_data["data"]["AccessToken"]
+        data = json_data["data"]
+        ttl = GREENROPE_TOKEN_TTL
+        for key in ("ExpiresIn", "ExpiresInSeconds"):
+            if str(data.get(key, "")).isdigit() and int(data[key]) > 0:
+                ttl = int(data[key])
+        self._token = data["AccessToken"]
+        self._token_expires = time.time() + ttl
         logging.info("GreenRope token acquired")
-        return greenrope_token
 
-    except Exception as e:
-        logging.error(f"[ERROR] Login failed: {str(e)}", exc_info=True)
-        raise
+    def token(self):
+        if self._token and time.time() < self._token_expires - GREENROPE_TOKEN_REFRESH_MARGIN:
+            return self._token
+        with self._token_lock:
+            # Another thread may have logged in while this one waited for the lock
+            if not self._token or time.time() >= self._token_expires - GREENROPE_TOKEN_REFRESH_MARGIN:
+                try:
+                    self._login()
+                except Exception as e:
+                    logging.error(f"[ERROR] Login failed: {str(e)}", exc_info=True)
+                    raise
+            return self._token
+
+    def invalidate_token(self, stale):
+        """Forget the token after a 401, unless another thread already replaced it."""
+        with self._token_lock:
+            if self._token == stale:
+                self._token = None
+
+    # --- requests ---
+
+    def _record(self, endpoint, seconds, ok):
+        with self._stats_lock:
+            s = self._stats.setdefault(endpoint, {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            s["calls"] += 1
+            s["errors"] += 0 if ok else 1
+            s["total_seconds"] += seconds
+            s["max_seconds"] = max(s["max_seconds"], seconds)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                endpoint: {**s, "avg_seconds": round(s["total_seconds"] / max(s["calls"], 1), 3),
+                           "total_seconds": round(s["total_seconds"], 3), "max_seconds": round(s["max_seconds"], 3)}
+                for endpoint, s in self._stats.items()
+            }
+
+    def _send(self, method, path, deadline=None, **kwargs):
+        """One HTTP call with retries on 429/5xx and connection errors; no auth handling.
+
+        Every attempt and backoff sleep fits before deadline (default: now +
+        GREENROPE_CALL_BUDGET). Read timeouts are not retried, since the
+        server may still be applying the request.
+        """
+        deadline = deadline or time.time() + GREENROPE_CALL_BUDGET
+        timeout = kwargs.pop("timeout", GREENROPE_TIMEOUT)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        endpoint = f"{method} {path}"
+        for attempt in range(self.max_retries + 1):
+            remaining = max(0.1, deadline - time.time())
+            read_timeout = read if attempt == 0 else min(read, GREENROPE_RETRY_READ_TIMEOUT)
+            start = time.time()
+            try:
+                response = self.session.request(method, self.base_url + path,
+                                                timeout=(min(connect, remaining), min(read_timeout, remaining)), **kwargs)
+            except requests.ReadTimeout:
+                self._record(endpoint, time.time() - start, ok=False)
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, time.time() - start, ok=False)
+                response, error, delay = None, e, None
+                logging.warning(f"[GREENROPE] {endpoint} attempt {attempt + 1} failed: {e}")
+            else:
+                self._record(endpoint, time.time() - start, ok=response.status_code < 400)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                logging.warning(f"[GREENROPE] {endpoint} returned {response.status_code}")
+                retry_after = response.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else None
+            delay = min(30, delay if delay is not None else 2 ** attempt + random.uniform(0, 1))
+            if attempt == self.max_retries or time.time() + delay >= deadline:
+                if response is None:
+                    raise error
+                return response
+            time.sleep(delay)
+
+    def request(self, method, path, headers=None, **kwargs):
+        """Authenticated call within GREENROPE_CALL_BUDGET; a 401 refreshes the token and retries once."""
+        deadline = time.time() + GREENROPE_CALL_BUDGET
+        for attempt in range(2):
+            token = self.token()
+            auth_headers = {
+                "Authorization": f"Bearer {token}",
+                "accountID": self.account_id,
+                "Content-Type": "application/json",
+                **(headers or {})
+            }
+            response = self._send(method, path, deadline=deadline, headers=auth_headers, **kwargs)
+            if response.status_code != 401 or attempt == 1:
+                return response
+            logging.warning(f"[GREENROPE] 401 on {method} {path}, refreshing token")
+            self.invalidate_token(token)
+
+    def put_contacts(self, contacts):
+        return self.request("PUT", "/contact", json={"Contacts": contacts})
+
+
+get_greenrope_client = per_process(GreenRopeClient)
+
+
+def get_greenrope_token():
+    """Current access token; kept for callers that build their own requests."""
+    return get_greenrope_client().token()
+
+
+def greenrope_stats():
+    return get_greenrope_client().stats()
@@ -1,22 +1,16 @@
-import requests
-import logging
 import os
+import time
+import logging
 import json
-from salesdrip_auth import get_greenrope_token
+from salesdrip_auth import get_greenrope_client
 
-GREENROPE_ACCOUNT = os.getenv("GREENROPE_ACCOUNT_ID")
+CRM_GROUP_NAME = "***2025 Ai Integrated Sales"
+CRM_BATCH_SIZE = int(os.getenv("CRM_BATCH_SIZE", "50"))  # contacts per PUT /contact
+SPLIT_STATUSES = {400, 422}  # payload rejections worth bisecting; other 4xx (auth, 429) fail the chunk
 
 
-def save_script_to_crm(email, rep_data, target_data, script_items, contact_id=None):
-    token = get_greenrope_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "accountID": GREENROPE_ACCOUNT,
-        "Content-Type": "application/json"
-    }
-
-    group_name = "***2025 Ai Integrated Sales"
-
+def build_script_contact(email, script_items, contact_id):
+    """GreenRope contact entry carrying the 44 script fields (11 blocks x 4 versions)."""
     # Validate and clean contact_id
     if not contact_id or not str(contact_id).isdigit():
         raise ValueError("❌ Invalid or missing contact_id")
@@ -103,26 +97,21 @@ def save_script_to_crm(email, rep_data, target_data, script_items, contact_id=No
         if safe_option(item, idx).strip()
     ]
 
-    payload = {
-        "Contacts": [
-            {
-                "contactId": contact_id,
-                "Email": email,
-                "Groups": [{"GroupName": group_name}],
-                "UserDefinedFields": user_fields
-            }
-        ]
+    return {
+        "contactId": contact_id,
+        "Email": email,
+        "Groups": [{"GroupName": CRM_GROUP_NAME}],
+        "UserDefinedFields": user_fields
     }
 
+
+def save_script_to_crm(email, rep_data, target_data, script_items, contact_id=None):
+    payload = {"Contacts": [build_script_contact(email, script_items, contact_id)]}
+
     logging.debug("[DEBUG] Payload to SalesDrip:\n%s", json.dumps(payload, indent=2))
 
     try:
-        response = requests.put(
-            "https://api.stgi.net/v2/api/contact",
-            headers=headers,
-            json=payload,
-            timeout=(10, 45)  # 10s connect timeout, 45s read timeout
-        )
+        response = get_greenrope_client().put_contacts(payload["Contacts"])
         logging.debug("[DEBUG] SalesDrip response: %s", response.text)
         response.raise_for_status()
         logging.info(f"✅ Contact {email} updated successfully in SalesDrip CRM.")
@@ -133,18 +122,10 @@ def save_script_to_crm(email, rep_data, target_data, script_items, contact_id=No
 
 
 
-def save_research_to_crm(email, company_name, research_data, contact_id):
+def build_research_contact(email, research_data, contact_id):
+    """GreenRope contact entry carrying the five research fields (FieldNum 1034-1038)."""
     import re
 
-    token = get_greenrope_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "accountID": GREENROPE_ACCOUNT,
-        "Content-Type": "application/json"
-    }
-
-    group_name = "***2025 Ai Integrated Sales"
-
     if not contact_id or not str(contact_id).isdigit():
         raise ValueError("❌ Invalid or missing contact_id")
 
@@ -212,26 +193,21 @@ def save_research_to_crm(email, company_name, research_data, contact_id):
         {"FieldNum": 1038, "FieldValue": strip_html(research_data.get("social_media", ""))}
     ]
 
-    payload = {
-        "Contacts": [
-            {
-                "contactId": int(contact_id),
-                "Email": email,
-                "Groups": [{"GroupName": group_name}],
-                "UserDefinedFields": user_fields
-            }
-        ]
+    return {
+        "contactId": int(contact_id),
+        "Email": email,
+        "Groups": [{"GroupName": CRM_GROUP_NAME}],
+        "UserDefinedFields": user_fields
     }
 
+
+def save_research_to_crm(email, company_name, research_data, contact_id):
+    payload = {"Contacts": [build_research_contact(email, research_data, contact_id)]}
+
     logging.debug("[DEBUG] Research Payload to SalesDrip:\n%s", json.dumps(payload, indent=2))
 
     try:
-        response = requests.put(
-            "https://api.stgi.net/v2/api/contact",
-            headers=headers,
-            json=payload,
-            timeout=(10, 45)  # 10s connect timeout, 45s read timeout
-        )
+        response = get_greenrope_client().put_contacts(payload["Contacts"])
         logging.debug("[DEBUG] SalesDrip response: %s", response.text)
         response.raise_for_status()
         logging.info(f"✅ Contact {email} (ID: {contact_id}) research fields updated successfully.")
@@ -239,3 +215,83 @@ def save_research_to_crm(email, company_name, research_data, contact_id):
     except Exception as e:
         logging.error(f"[ERROR] Failed to update research data for contact {email} (ID: {contact_id}): {e}", exc_info=True)
         return False
+
+
+def research_payload_from_results(results):
+    """Shape run_ethical_scraper results into the research_data save_research_to_crm expects."""
+    return {
+        "facts": results.get("company_facts", {}),
+        "products_services": results.get("products_services", {}),
+        "locations": results.get("locations", ""),
+        "recent_blog_posts": results.get("articles", []),
+        "social_media": "; ".join(f"{k}: {v}" for k, v in results.get("social_media", {}).items())
+    }
+
+
+# --- Batched Export ---
+
+def _put_chunk(contacts, results, deadline=None):
+    """PUT one chunk; on a 400/422, split it to find the contacts GreenRope rejects."""
+    if deadline is not None and time.time() >= deadline:
+        status, error = None, "not sent: batch ran out of time"
+    else:
+        try:
+            response = get_greenrope_client().put_contacts(contacts)
+            status, error = response.status_code, None if response.ok else response.text[:500]
+        except Exception as e:
+            status, error = None, str(e)
+
+    if error and status in SPLIT_STATUSES and len(contacts) > 1:
+        middle = len(contacts) // 2
+        _put_chunk(contacts[:middle], results, deadline)
+        _put_chunk(contacts[middle:], results, deadline)
+        return
+
+    for contact in contacts:
+        results[contact["contactId"]] = {"ok": error is None, "status": status, "error": error}
+
+
+def push_contacts(contacts, chunk_size=CRM_BATCH_SIZE, deadline=None):
+    """Send many GreenRope contact entries in chunks of chunk_size.
+
+    Returns one result per contact, in order:
+    {"contact_id", "email", "ok", "status", "error"}. A chunk GreenRope
+    rejects with a 400 or 422 is split in halves until the bad contacts are
+    isolated, so one malformed entry doesn't fail the others. A chunk that
+    fails any other way (401/403, 429, 5xx, network, after the client's
+    retries) fails as a whole. No PUT is started after deadline (a
+    time.time() value); contacts left unsent then fail.
+    """
+    contacts = list(contacts)
+    results = {}
+    for start in range(0, len(contacts), chunk_size):
+        _put_chunk(contacts[start:start + chunk_size], results, deadline)
+
+    report = [{"contact_id": c["contactId"], "email": c["Email"], **results[c["contactId"]]} for c in contacts]
+    failed = sum(1 for r in report if not r["ok"])
+    logging.info(f"📦 CRM batch: {len(report) - failed}/{len(report)} contacts updated, {failed} failed")
+    return report
+
+
+def _push_built(entries, build):
+    # Entries whose payload can't be built (bad contact_id) fail without being sent
+    contacts, report = [], []
+    for entry in entries:
+        try:
+            contacts.append(build(entry))
+            report.append(None)
+        except Exception as e:
+            report.append({"contact_id": entry.get("contact_id"), "email": entry.get("email"),
+                           "ok": False, "status": None, "error": str(e)})
+    sent = iter(push_contacts(contacts))
+    return [r if r is not None else next(sent) for r in report]
+
+
+def save_scripts_batch_to_crm(entries):
+    """Batched save_script_to_crm: entries are dicts with email, contact_id and script_items."""
+    return _push_built(entries, lambda e: build_script_contact(e["email"], e["script_items"], e["contact_id"]))
+
+
+def save_research_batch_to_crm(entries):
+    """Batched save_research_to_crm: entries are dicts with email, contact_id and research_data."""
+    return _push_built(entries, lambda e: build_research_contact(e["email"], e["research_data"], e["contact_id"]))
@@ -0,0 +1,99 @@
+import re
+
+SCRIPT_BLOCKS = 11
+OPTIONS_PER_BLOCK = 4
+
+BLOCK_HEADER_RE = re.compile(r"^(\d+)\.\s*(.*)")
+
+
+class ScriptStreamParser:
+    """Parses the numbered script format ("1. Label" then "- option" lines) as text arrives.
+
+    feed() takes any slice of the completion and returns the blocks that
+    became complete, as (number, item) pairs with number taken from the
+    block's own header. A block is complete once it has options_per_block
+    options or the next block starts. Blocks numbered outside the prompt, or
+    repeating an earlier number, are not returned. close() flushes the rest.
+    items always holds everything parsed so far, in order.
+    """
+
+    def __init__(self, prompt_descriptions, options_per_block=OPTIONS_PER_BLOCK):
+        self.prompt_descriptions = prompt_descriptions
+        self.options_per_block = options_per_block
+        self.items = []
+        self._numbers = []  # block number from each item's header, parallel to items
+        self._buffer = ""
+        self._emitted = 0
+        self._returned = set()  # block numbers already handed out by feed/close
+
+    def _line(self, line):
+        line = line.strip()
+        match = BLOCK_HEADER_RE.match(line)
+        if match:
+            idx = int(match.group(1)) - 1
+            label_text = match.group(2).strip()
+            if not label_text:
+                label_text = self.prompt_descriptions[idx] if 0 <= idx < len(self.prompt_descriptions) else f"Block {idx+1}"
+            self.items.append({"label": label_text, "options": []})
+            self._numbers.append(idx + 1)
+        elif line.startswith("- ") and self.items:
+            self.items[-1]["options"].append(line[2:].strip())
+
+    def _ready(self, final=False):
+        complete = len(self.items)
+        if not final and self.items and len(self.items[-1]["options"]) < self.options_per_block:
+            complete -= 1
+        ready = []
+        for i in range(self._emitted, complete):
+            number = self._numbers[i]
+            if 1 <= number <= len(self.prompt_descriptions) and number not in self._returned:
+                self._returned.add(number)
+                ready.append((number, self.items[i]))
+        self._emitted = max(self._emitted, complete)
+        return ready
+
+    def feed(self, text):
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._line(line)
+        return self._ready()
+
+    def close(self):
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = ""
+        return self._ready(final=True)
+
+    def complete_blocks(self):
+        """Well-formed blocks keyed by their 1-based number.
+
+        A block counts when its number is in range and it has at least
+        options_per_block options; extras are dropped. The first block
+        seen for a number wins.
+        """
+        blocks = {}
+        for number, item in zip(self._numbers, self.items):
+            if number in blocks or not 1 <= number <= len(self.prompt_descriptions):
+                continue
+            if len(item["options"]) >= self.options_per_block:
+                blocks[number] = {"label": item["label"], "options": item["options"][:self.options_per_block]}
+        return blocks
+
+
+def parse_script(raw_output, prompt_descriptions):
+    parser = ScriptStreamParser(prompt_descriptions)
+    parser.feed(raw_output)
+    parser.close()
+    return parser.items
+
+
+def complete_script_blocks(raw_output, prompt_descriptions):
+    parser = ScriptStreamParser(prompt_descriptions)
+    parser.feed(raw_output)
+    parser.close()
+    return parser.complete_blocks()
+
+
+def is_valid_script(script_items, blocks=SCRIPT_BLOCKS, options=OPTIONS_PER_BLOCK):
+    return len(script_items) == blocks and all(len(item["options"]) == options for item in script_items)
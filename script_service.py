@@ -0,0 +1,354 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import as_completed
+
+from openai import AsyncOpenAI
+
+from background import LoopThread, per_process
+from script_parser import ScriptStreamParser, parse_script, complete_script_blocks, is_valid_script
+
+SCRIPT_MODEL = os.getenv("SCRIPT_MODEL", "gpt-4o")
+SCRIPT_TEMPERATURE = 0.5
+SCRIPT_MAX_TOKENS = 2500
+SCRIPT_TOKENS_PER_BLOCK = 250  # the full 11-block script fits in SCRIPT_MAX_TOKENS
+SCRIPT_MAX_IN_FLIGHT = int(os.getenv("SCRIPT_MAX_IN_FLIGHT", "8"))
+SCRIPT_TIMEOUT = float(os.getenv("SCRIPT_TIMEOUT", "60"))
+SCRIPT_REPAIR_ATTEMPTS = int(os.getenv("SCRIPT_REPAIR_ATTEMPTS", "1"))
+# "single": one completion for all 11 blocks. "sections": one completion per
+# section in SCRIPT_SECTIONS, run concurrently and merged.
+SCRIPT_GENERATION_MODE = os.getenv("SCRIPT_GENERATION_MODE", "single").strip().lower()
+SCRIPT_SECTIONS = os.getenv("SCRIPT_SECTIONS", "1-4,5-8,9-11")
+
+SCRIPT_PROMPT_DESCRIPTIONS = [
+    "Opening: Start with 'Good morning' or 'Good afternoon', give the rep's name and company, and ask a closed-ended factual question about the target company related to freight between USA and Canada.",
+    "Customer Assessment: Ask a closed-ended question that probes how the target manages its freight operations across USA/Canada.",
+    "Needs Assessment: Ask a closed-ended question about the company’s current or upcoming freight needs.",
+    "Risk Assessment: Ask a closed-ended question that highlights risk and consequences of not addressing freight gaps.",
+    "Solution Assessment: Ask a closed-ended question about what the company looks for in a freight partner.",
+    "Needs Objection: Ask a closed-ended question countering the 'we're happy with our current carrier' objection.",
+    "Service Objection: Ask a closed-ended question addressing prior service dissatisfaction.",
+    "Source Objection: Ask a closed-ended question addressing concerns about using brokers.",
+    "Price Objection: Ask a closed-ended question about value relative to cost.",
+    "Time Objection: Ask a closed-ended question countering the 'not a good time' objection.",
+    "Closing Question: Ask a closed-ended final call-to-action or decision qualifier question."
+]
+
+
+# --- Prompts ---
+
+def build_script_prompt(rep_data, target_data, prompt_descriptions):
+    return f"""
+You are a professional cold call script assistant.
+
+Sales Rep: {rep_data['rep_name']} from {rep_data['rep_company']}.
+They are selling: {rep_data['product']}.
+Target company: {target_data['target_name']}.
+
+Please return exactly 11 blocks.
+Each block must be numbered 1–11, and contain exactly 4 bullet points:
+- version A
+- version B
+- version C
+- version D
+
+Do not add commentary. Do not change format. Do not skip numbers.
+
+Instructions:
+""" + "\n".join([f"{i+1}. {desc}" for i, desc in enumerate(prompt_descriptions)])
+
+
+def build_blocks_prompt(rep_data, target_data, prompt_descriptions, numbers):
+    """Prompt for just the given block numbers; used for sections and repairs."""
+    return f"""
+You are a professional cold call script assistant.
+
+Sales Rep: {rep_data['rep_name']} from {rep_data['rep_company']}.
+They are selling: {rep_data['product']}.
+Target company: {target_data['target_name']}.
+
+Please return only the {len(numbers)} block(s) below, keeping their numbers.
+Each block must contain exactly 4 bullet points:
+- version A
+- version B
+- version C
+- version D
+
+Do not add commentary. Do not change format. Do not add other blocks.
+
+Instructions:
+""" + "\n".join([f"{n}. {prompt_descriptions[n - 1]}" for n in numbers])
+
+
+def parse_sections(spec, block_count):
+    """Turn "1-4,5-8,9-11" into [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11]].
+
+    Numbers outside 1..block_count are dropped, and any block no section
+    covers gets a final section of its own.
+    """
+    sections = []
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        numbers = [n for n in range(int(first), int(last or first) + 1) if 1 <= n <= block_count]
+        if numbers:
+            sections.append(numbers)
+    covered = {n for numbers in sections for n in numbers}
+    leftover = [n for n in range(1, block_count + 1) if n not in covered]
+    if leftover:
+        sections.append(leftover)
+    return sections
+
+
+# --- Script Service ---
+
+class ScriptService(LoopThread):
+    """Script generation on a long-lived AsyncOpenAI client and event-loop thread.
+
+    One instance per worker process. At most max_in_flight completions run
+    at once; callers beyond that wait their turn, and the wait is recorded
+    separately from the call time in stats().
+    """
+
+    thread_name = "script-service"
+
+    def __init__(self, max_in_flight=SCRIPT_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "calls": 0,
+            "failures": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "call_seconds": 0.0,
+            "queue_seconds": 0.0,
+            "repairs": 0,
+        }
+        super().__init__()
+
+    async def _setup(self):
+        self._client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=SCRIPT_TIMEOUT)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def _shutdown(self):
+        await self._client.close()
+
+    # --- metrics ---
+
+    def _record(self, kind, queued, started, usage=None, ok=True):
+        now = time.time()
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self._metrics_lock:
+            m = self._metrics
+            m["calls"] += 1
+            m["failures"] += 0 if ok else 1
+            m["prompt_tokens"] += prompt_tokens
+            m["completion_tokens"] += completion_tokens
+            m["call_seconds"] += now - started
+            m["queue_seconds"] += started - queued
+        logging.info(
+            f"{'✅' if ok else '❌'} Script {kind} call: {now - started:.2f}s "
+            f"(queued {started - queued:.2f}s), {prompt_tokens} prompt + {completion_tokens} completion tokens"
+        )
+
+    def stats(self):
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        calls = max(m["calls"], 1)
+        m["avg_call_seconds"] = round(m["call_seconds"] / calls, 3)
+        m["avg_queue_seconds"] = round(m["queue_seconds"] / calls, 3)
+        m["call_seconds"] = round(m["call_seconds"], 3)
+        m["queue_seconds"] = round(m["queue_seconds"], 3)
+        m["max_in_flight"] = self.max_in_flight
+        return m
+
+    # --- completions ---
+
+    async def complete(self, prompt, max_tokens=SCRIPT_MAX_TOKENS, kind="script"):
+        queued = time.time()
+        async with self._in_flight:
+            started = time.time()
+            try:
+                response = await self._client.chat.completions.create(
+                    model=SCRIPT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=SCRIPT_TEMPERATURE,
+                    max_tokens=max_tokens
+                )
+            except Exception:
+                self._record(kind, queued, started, ok=False)
+                raise
+        self._record(kind, queued, started, response.usage)
+        return response.choices[0].message.content.strip()
+
+    async def _stream(self, prompt, max_tokens=SCRIPT_MAX_TOKENS):
+        queued = time.time()
+        async with self._in_flight:
+            started = time.time()
+            usage = None
+            try:
+                stream = await self._client.chat.completions.create(
+                    model=SCRIPT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=SCRIPT_TEMPERATURE,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception:
+                self._record("stream", queued, started, usage, ok=False)
+                raise
+        self._record("stream", queued, started, usage)
+
+    def iter_completion(self, prompt, max_tokens=SCRIPT_MAX_TOKENS):
+        """Sync generator over the completion text of prompt as it streams in."""
+        return self.iterate(self._stream(prompt, max_tokens))
+
+    async def repair(self, blocks, rep_data, target_data, prompt_descriptions):
+        """Fill in whatever blocks (number -> item) is missing by re-requesting only those.
+
+        Returns the full list of script_items, or None if blocks are still
+        missing after SCRIPT_REPAIR_ATTEMPTS follow-up calls.
+        """
+        blocks = dict(blocks)
+        all_numbers = range(1, len(prompt_descriptions) + 1)
+        for attempt in range(SCRIPT_REPAIR_ATTEMPTS):
+            missing = [n for n in all_numbers if n not in blocks]
+            if not missing:
+                break
+            logging.warning(f"🔧 Re-requesting script blocks {missing} (attempt {attempt + 1})")
+            with self._metrics_lock:
+                self._metrics["repairs"] += 1
+            try:
+                output = await self.complete(
+                    build_blocks_prompt(rep_data, target_data, prompt_descriptions, missing),
+                    max_tokens=SCRIPT_TOKENS_PER_BLOCK * len(missing),
+                    kind="repair"
+                )
+            except Exception as e:
+                logging.error(f"❌ Script repair call failed: {e}")
+                break
+            repaired = complete_script_blocks(output, prompt_descriptions)
+            blocks.update({n: item for n, item in repaired.items() if n in missing})
+
+        missing = [n for n in all_numbers if n not in blocks]
+        if missing:
+            logging.error(f"❌ Script blocks {missing} still missing after repair")
+            return None
+        return [blocks[n] for n in all_numbers]
+
+    async def generate_section(self, rep_data, target_data, prompt_descriptions, numbers):
+        """Well-formed blocks (number -> item) for one section; {} if the call fails."""
+        try:
+            output = await self.complete(
+                build_blocks_prompt(rep_data, target_data, prompt_descriptions, numbers),
+                max_tokens=SCRIPT_TOKENS_PER_BLOCK * len(numbers),
+                kind="section"
+            )
+        except Exception as e:
+            logging.error(f"❌ Script section {numbers} failed: {e}")
+            return {}
+        blocks = complete_script_blocks(output, prompt_descriptions)
+        return {n: item for n, item in blocks.items() if n in numbers}
+
+    async def generate(self, rep_data, target_data, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS, mode=None):
+        """Full script for one rep/target pair: 11 blocks of 4 options, or None."""
+        if (mode or SCRIPT_GENERATION_MODE) == "sections":
+            sections = parse_sections(SCRIPT_SECTIONS, len(prompt_descriptions))
+            blocks = {}
+            for section in await asyncio.gather(*(
+                self.generate_section(rep_data, target_data, prompt_descriptions, numbers) for numbers in sections
+            )):
+                blocks.update(section)
+            return await self.repair(blocks, rep_data, target_data, prompt_descriptions)
+
+        raw_output = await self.complete(build_script_prompt(rep_data, target_data, prompt_descriptions))
+        script_items = parse_script(raw_output, prompt_descriptions)
+        if not is_valid_script(script_items):
+            logging.warning("⚠️ Script format error — expected 11 blocks with 4 options each, repairing")
+            logging.warning("🔍 Full OpenAI response:\n" + raw_output)
+            script_items = await self.repair(
+                complete_script_blocks(raw_output, prompt_descriptions), rep_data, target_data, prompt_descriptions
+            )
+        return script_items
+
+    def _stream_sections(self, rep_data, target_data, prompt_descriptions):
+        # Sections finish in any order; each block goes out under its own number
+        sections = parse_sections(SCRIPT_SECTIONS, len(prompt_descriptions))
+        futures = [
+            self.submit(self.generate_section(rep_data, target_data, prompt_descriptions, numbers))
+            for numbers in sections
+        ]
+        blocks = {}
+        for future in as_completed(futures):
+            section = future.result()
+            blocks.update(section)
+            for n in sorted(section):
+                yield "block", {"index": n - 1, **section[n]}
+
+        script_items = self.run(self.repair(blocks, rep_data, target_data, prompt_descriptions))
+        if not script_items:
+            yield "failed", {"error": "AI response was incomplete or misformatted."}
+            return
+        yield "done", {"script_items": script_items}
+
+    def stream(self, rep_data, target_data, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS, mode=None):
+        """Sync generator of (event, data) pairs while a script streams in.
+
+        ("block", {"index", "label", "options"}) as each block completes, then
+        ("done", {"script_items"}) with the validated, repaired script, or
+        ("failed", {"error"}).
+        """
+        if (mode or SCRIPT_GENERATION_MODE) == "sections":
+            yield from self._stream_sections(rep_data, target_data, prompt_descriptions)
+            return
+
+        parser = ScriptStreamParser(prompt_descriptions)
+        raw_output = ""
+        try:
+            for text in self.iter_completion(build_script_prompt(rep_data, target_data, prompt_descriptions)):
+                raw_output += text
+                for number, item in parser.feed(text):
+                    yield "block", {"index": number - 1, **item}
+            for number, item in parser.close():
+                yield "block", {"index": number - 1, **item}
+        except Exception as e:
+            logging.exception("🔥 Script streaming error")
+            yield "failed", {"error": str(e)}
+            return
+
+        script_items = parser.items
+        if not is_valid_script(script_items):
+            logging.warning("⚠️ Script format error — expected 11 blocks with 4 options each, repairing")
+            logging.warning("🔍 Full OpenAI response:\n" + raw_output)
+            script_items = self.run(self.repair(
+                complete_script_blocks(raw_output, prompt_descriptions), rep_data, target_data, prompt_descriptions
+            ))
+            if not script_items:
+                yield "failed", {"error": "AI response was incomplete or misformatted."}
+                return
+        yield "done", {"script_items": script_items}
+
+
+get_script_service = per_process(ScriptService, on_exit=ScriptService.close)
+
+
+def generate_script(rep_data, target_data, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS, mode=None):
+    service = get_script_service()
+    return service.run(service.generate(rep_data, target_data, prompt_descriptions, mode=mode))
+
+
+def stream_script(rep_data, target_data, prompt_descriptions=SCRIPT_PROMPT_DESCRIPTIONS, mode=None):
+    return get_script_service().stream(rep_data, target_data, prompt_descriptions, mode=mode)
+
+
+def script_stats():
+    """Call, token and timing totals for this worker's script service."""
+    return get_script_service().stats()
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# research_engine and script_service refuse to import without a key; tests never call OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
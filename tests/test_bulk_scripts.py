@@ -0,0 +1,116 @@
+import csv
+import json
+
+import pytest
+
+import bulk_scripts
+import salesdrip_export
+from bulk_scripts import LocalBatchStub, read_records, run
+from script_service import SCRIPT_PROMPT_DESCRIPTIONS
+
+
+class FakeScriptService:
+    """Stands in for the script service: repair fills every missing block with canned options."""
+
+    def __init__(self):
+        self.repaired = []
+
+    def run(self, result):
+        return result
+
+    def repair(self, blocks, rep_data, target_data, prompt_descriptions):
+        self.repaired.append(sorted(blocks))
+        return [
+            blocks.get(n) or {"label": f"Repaired {n}", "options": [f"repaired {n}{v}" for v in "ABCD"]}
+            for n in range(1, len(prompt_descriptions) + 1)
+        ]
+
+
+def malformed_for_gamma(body):
+    """Canned script, except Gamma's loses block 5."""
+    script = LocalBatchStub.canned_script(body)
+    if "Target company: Gamma" in body["messages"][0]["content"]:
+        script = script.replace("5. ", "5x ")
+    return script
+
+
+class FailingRowStub(LocalBatchStub):
+    """Local batch whose row-2 request comes back as a 500."""
+
+    def results(self, batch_id):
+        lines = super().results(batch_id)
+        for line in lines:
+            if line["custom_id"] == "row-2":
+                line["response"]["status_code"] = 500
+                line["response"]["body"] = {"error": {"message": "server error"}}
+        return lines
+
+
+@pytest.fixture
+def records(tmp_path):
+    path = tmp_path / "contacts.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["rep_name", "rep_company", "product", "target_name", "email", "contact_id"])
+        writer.writeheader()
+        for i, target in enumerate(["Alpha", "Gamma", "Delta"]):
+            writer.writerow({"rep_name": "Sam", "rep_company": "Acme Freight", "product": "LTL shipping",
+                             "target_name": target, "email": f"{target.lower()}@example.com", "contact_id": str(100 + i)})
+    return read_records(str(path))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    fake = FakeScriptService()
+    monkeypatch.setattr(bulk_scripts, "get_script_service", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def crm_calls(monkeypatch):
+    calls = []
+
+    def save_scripts_batch_to_crm(entries):
+        calls.append(entries)
+        return [{"contact_id": int(e["contact_id"]), "email": e["email"], "ok": True, "status": 200, "error": None}
+                for e in entries]
+
+    monkeypatch.setattr(salesdrip_export, "save_scripts_batch_to_crm", save_scripts_batch_to_crm)
+    return calls
+
+
+def read_output(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_run_repairs_malformed_script_and_reports_failed_request(tmp_path, records, service, crm_calls):
+    output = tmp_path / "scripts.jsonl"
+    run(records, str(output), FailingRowStub(respond=malformed_for_gamma), poll_seconds=0)
+
+    alpha, gamma, delta = read_output(output)
+    assert alpha["script_items"] == [
+        {"label": desc.split(":")[0], "options": [f"{desc.split(':')[0]} version {v}" for v in "ABCD"]}
+        for desc in SCRIPT_PROMPT_DESCRIPTIONS
+    ]
+    assert service.repaired == [[1, 2, 3, 4, 6, 7, 8, 9, 10, 11]]
+    assert gamma["script_items"][4] == {"label": "Repaired 5", "options": ["repaired 5A", "repaired 5B", "repaired 5C", "repaired 5D"]}
+    assert delta["script_items"] is None
+    assert "server error" in delta["error"]
+
+    assert [[e["contact_id"] for e in entries] for entries in crm_calls] == [["100", "101"]]
+    assert [r["synced"] for r in (alpha, gamma, delta)] == [True, True, False]
+
+
+def test_dry_run_skips_crm_export(tmp_path, records, service, crm_calls):
+    output = tmp_path / "scripts.jsonl"
+    run(records, str(output), LocalBatchStub(), dry_run=True, poll_seconds=0)
+
+    results = read_output(output)
+    assert all(r["script_items"] and not r["synced"] for r in results)
+    assert crm_calls == []
+    assert service.repaired == []
+
+
+def test_local_batch_id_is_rejected(tmp_path):
+    with pytest.raises(SystemExit) as exc:
+        bulk_scripts.main([str(tmp_path / "contacts.csv"), "--local", "--batch-id", "batch_local_abc"])
+    assert exc.value.code == 2
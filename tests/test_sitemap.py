@@ -0,0 +1,33 @@
+import gzip
+from pathlib import Path
+
+from research_engine import iter_sitemap_entries
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def chunked(data, size=64):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_image_and_video_locs_do_not_replace_page_url():
+    data = (FIXTURES / "sitemap_images.xml").read_bytes()
+    assert list(iter_sitemap_entries(chunked(data))) == [
+        ("url", "https://shop.com/products/widget", "2025-03-01"),
+        ("url", "https://shop.com/products/gadget", ""),
+        ("url", "https://shop.com/blogs/news/launch", ""),
+    ]
+
+
+def test_gzipped_sitemap_index():
+    index = (
+        b'<?xml version="1.0" encoding="UTF-8"?>'
+        b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        b'<sitemap><loc>https://shop.com/sitemap_products_1.xml</loc><lastmod>2025-03-02</lastmod></sitemap>'
+        b'<sitemap><loc>https://shop.com/sitemap_blogs_1.xml</loc></sitemap>'
+        b'</sitemapindex>'
+    )
+    assert list(iter_sitemap_entries(chunked(gzip.compress(index)))) == [
+        ("sitemap", "https://shop.com/sitemap_products_1.xml", "2025-03-02"),
+        ("sitemap", "https://shop.com/sitemap_blogs_1.xml", ""),
+    ]
@@ -0,0 +1,37 @@
+from research_engine import extract_social_profiles
+
+HOME = """
+<a href="https://twitter.com/sharecare">Twitter</a>
+<a href="https://www.facebook.com/SharePoint">Facebook</a>
+<a href="https://twitter.com/intentsoftware">Partner</a>
+<a href="https://twitter.com/intent/tweet?text=hello">Tweet this</a>
+<a href="https://www.facebook.com/sharer/sharer.php?u=https://sharecare.com">Share</a>
+<a href="https://www.facebook.com/sharer.php?u=https://sharecare.com">Share</a>
+<a href="https://www.facebook.com/plugins/page.php?href=sharecare">Like</a>
+<a href="https://www.youtube.com/embed/abc123">Video</a>
+"""
+
+
+class FakePages:
+    """PageStore stand-in serving HOME for the home page and nothing else."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def prefetch(self, urls):
+        pass
+
+    def html(self, url):
+        return HOME if url == self.base_url else None
+
+
+def test_share_links_dropped_but_profiles_starting_with_share_kept():
+    base_url = "https://sharecare.com"
+    profiles = extract_social_profiles(base_url, pages=FakePages(base_url))
+
+    urls = {platform: [c["url"] for c in candidates] for platform, candidates in profiles.items()}
+    assert urls == {
+        "Twitter": ["https://twitter.com/sharecare", "https://twitter.com/intentsoftware"],
+        "Facebook": ["https://www.facebook.com/SharePoint"],
+    }
+    assert profiles["Twitter"][0]["score"] == 3